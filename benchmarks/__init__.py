@@ -0,0 +1,9 @@
+"""Jeu de données synthétique et mesures de performance de database.py.
+
+À lancer contre un mongod local, jamais sur la base de production :
+
+    python -m benchmarks generate --products 200000 --movements 5000000 --history 10000000
+    python -m benchmarks run --output apres.json
+    python -m benchmarks compare avant.json apres.json
+"""
+BENCH_DATABASE = 'gestion_stock_bench'
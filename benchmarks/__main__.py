@@ -0,0 +1,72 @@
+import argparse
+import json
+from database import configure
+from . import BENCH_DATABASE
+from .generator import DEFAULT_VOLUMES, generate
+from .run import BENCHMARKS, run_benchmarks, save_results, compare_results
+
+# ===========================
+# Ligne de commande des benchmarks
+# ===========================
+def cmd_generate(args):
+    configure(database=args.database)
+    generate(**{name: getattr(args, name) for name in DEFAULT_VOLUMES}, seed=args.seed, days=args.days,
+             batch_size=args.batch_size, reset=args.reset)
+
+def cmd_run(args):
+    configure(database=args.database)
+    report = run_benchmarks(names=args.only, iterations=args.iterations, seed=args.seed, profile=args.profile)
+    for name, check in report['checks'].items():
+        print(f"{name} : {'OK' if check['ok'] else 'ÉCHEC'} {check}")
+    if args.output:
+        save_results(report, args.output)
+        print(f"Résultats écrits dans {args.output}")
+
+def cmd_compare(args):
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+    regressions = 0
+    for name, old_p50, new_p50, p50_ratio, p95_ratio, regression in compare_results(before, after, args.threshold):
+        regressions += regression
+        print(f"{name:35} {old_p50:>9} -> {new_p50:>9} ms  x{p50_ratio:<5} (p95 x{p95_ratio}){'  RÉGRESSION' if regression else ''}")
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+DATABASE_ARG = ('--database', {'default': BENCH_DATABASE, 'help': "Base cible (jamais la base de production)"})
+SEED_ARG = ('--seed', {'type': int, 'default': 42})
+
+# nom: (fonction, aide, arguments)
+COMMANDS = {
+    'generate': (cmd_generate, "Génère un jeu de données synthétique reproductible", [
+        DATABASE_ARG, SEED_ARG,
+        ('--days', {'type': int, 'default': 730, 'help': "Période couverte par les mouvements"}),
+        ('--batch-size', {'type': int, 'default': 10000}),
+        ('--reset', {'action': 'store_true', 'help': "Vide les collections avant de générer"}),
+        *[(f'--{name}', {'type': int, 'default': default}) for name, default in DEFAULT_VOLUMES.items()],
+    ]),
+    'run': (cmd_run, "Exécute les mesures et affiche latences et débits", [
+        DATABASE_ARG, SEED_ARG,
+        ('--only', {'nargs': '*', 'help': f"Sous-chaînes des mesures à lancer parmi : {', '.join(BENCHMARKS)}"}),
+        ('--iterations', {'type': int, 'help': "Remplace le nombre d'itérations de chaque mesure"}),
+        ('--profile', {'action': 'store_true', 'help': "Ajoute les allers-retours serveur par opération"}),
+        ('--output', {'help': "Fichier JSON des résultats"}),
+    ]),
+    'compare': (cmd_compare, "Compare deux fichiers de résultats", [
+        ('before', {}), ('after', {}),
+        ('--threshold', {'type': float, 'default': 0.10, 'help': "Hausse du p50 signalée comme régression"}),
+        ('--fail-on-regression', {'action': 'store_true'}),
+    ]),
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Benchmarks de database.py")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (func, help_text, arguments) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flag, options in arguments:
+            subparser.add_argument(flag, **options)
+        subparser.set_defaults(func=func)
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,211 @@
+import random
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+import database
+from database import (
+    DB, SEARCH_FIELDS, ensure_indexes, hash_password, search_keys,
+    rebuild_daily_rollups, take_stock_snapshot, archive_history
+)
+
+# ===========================
+# Générateur de données synthétiques
+# ===========================
+NOUNS = ['Câble', 'Écran', 'Clavier', 'Souris', 'Chargeur', 'Disque', 'Routeur', 'Casque', 'Imprimante',
+         'Batterie', 'Lampe', 'Ventilateur', 'Perceuse', 'Tournevis', 'Cahier', 'Stylo', 'Chaise', 'Bureau']
+ADJECTIVES = ['noir', 'blanc', 'rouge', 'pro', 'mini', 'sans fil', 'USB-C', 'HDMI', 'portable', 'renforcé',
+              'économique', 'premium', 'compact', 'étanche', 'industriel']
+CATEGORIES = ['Électronique', 'Informatique', 'Bureautique', 'Outillage', 'Mobilier', 'Éclairage',
+              'Fournitures', 'Réseau', 'Audio', 'Énergie']
+DESTINATIONS = ['Vente', 'Vente en ligne', 'Retour fournisseur', 'Transfert dépôt', 'Casse', 'Usage interne']
+ACTIONS = ['Entrée stock', 'Sortie stock', 'Modification produit', 'Ajout produit', 'Suppression entrée']
+FIRST_NAMES = ['Tojo', 'Hery', 'Fara', 'Nirina', 'Lova', 'Mialy', 'Rado', 'Soa', 'Andry', 'Voahirana']
+LAST_NAMES = ['Rakoto', 'Rabe', 'Randria', 'Rasoa', 'Razafy', 'Andria', 'Ravelo', 'Rajaona']
+
+DEFAULT_VOLUMES = {
+    'products': 200000,
+    'suppliers': 500,
+    'users': 50,
+    'movements': 5000000,
+    'history': 10000000,
+}
+COLLECTIONS = ['produits', 'fournisseurs', 'categories', 'utilisateurs', 'entrees_stock', 'sorties_stock',
+               'historique', 'historique_archive', 'mouvements_journaliers', 'stock_snapshots',
+               'stock_snapshot_chunks', 'meta']
+
+
+class Generator:
+    """Remplit la base courante de façon reproductible : même graine, mêmes documents.
+
+    Les mouvements suivent une loi de Zipf sur les produits (quelques produits très
+    actifs) et sont générés dans l'ordre chronologique sur `days` jours : une sortie
+    ne dépasse jamais le stock du produit à sa date, donc le stock passé
+    (stock_as_of) n'est jamais négatif. quantite_stock de chaque produit est la
+    somme des entrées moins les sorties.
+    """
+    def __init__(self, seed: int = 42, days: int = 730, batch_size: int = 10000, now: datetime = None):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.batch_size = batch_size
+        self.now = now or datetime.now()
+
+    def _date(self) -> datetime:
+        return self.now - timedelta(seconds=self.rng.random() * self.days * 86400)
+
+    def _insert(self, collection: str, docs):
+        """Insère un itérable de documents par lots ; retourne le nombre inséré"""
+        return self._insert_mixed((collection, doc) for doc in docs).get(collection, 0)
+
+    def _insert_mixed(self, pairs) -> dict:
+        """Insère un itérable de (collection, document) par lots ; retourne le nombre inséré par collection"""
+        counts, batches = {}, {}
+        for collection, doc in pairs:
+            batch = batches.setdefault(collection, [])
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                DB[collection].insert_many(batch, ordered=False)
+                counts[collection] = counts.get(collection, 0) + len(batch)
+                batch.clear()
+        for collection, batch in batches.items():
+            if batch:
+                DB[collection].insert_many(batch, ordered=False)
+            counts[collection] = counts.get(collection, 0) + len(batch)
+        return counts
+
+    def reference_data(self, suppliers: int, users: int):
+        self._insert('categories', (
+            {'nom_categorie': name, 'description': f"Articles {name.lower()}",
+             'mots_cles': search_keys({'nom_categorie': name}, SEARCH_FIELDS['categories'])}
+            for name in CATEGORIES
+        ))
+        self.suppliers = []
+        for i in range(suppliers):
+            doc = {'_id': ObjectId(), 'nom_fournisseur': f"Fournisseur {self.rng.choice(LAST_NAMES)} {i}",
+                   'contact': f"034{self.rng.randrange(10**7):07d}", 'email': f"fournisseur{i}@exemple.mg",
+                   'adresse': f"Lot {self.rng.randrange(1, 999)} Antananarivo"}
+            doc['mots_cles'] = search_keys(doc, SEARCH_FIELDS['fournisseurs'])
+            self.suppliers.append(doc)
+        self._insert('fournisseurs', self.suppliers)
+        password = hash_password('bench')  # bcrypt est lent : un seul hash partagé
+        roles = ['admin', 'manager', 'user', 'user']
+        self.users = []
+        for i in range(users):
+            doc = {'_id': ObjectId(), 'nom': self.rng.choice(LAST_NAMES), 'prenom': self.rng.choice(FIRST_NAMES),
+                   'email': f"utilisateur{i}@exemple.mg", 'role': roles[i % len(roles)],
+                   'mot_de_passe': password, 'date_creation': self._date()}
+            doc['mots_cles'] = search_keys(doc, SEARCH_FIELDS['utilisateurs'])
+            self.users.append(doc)
+        self._insert('utilisateurs', self.users)
+
+    def products(self, count: int):
+        """Prépare les produits (insérés après les mouvements, avec leur stock final)"""
+        self.products_list = []
+        for i in range(count):
+            supplier = self.rng.choice(self.suppliers) if self.suppliers else {}
+            self.products_list.append({
+                '_id': ObjectId(),
+                'nom': f"{self.rng.choice(NOUNS)} {self.rng.choice(ADJECTIVES)}",  # Noms partagés volontairement
+                'reference': f"REF{i:07d}",
+                'categorie': self.rng.choice(CATEGORIES),
+                'fournisseur': supplier.get('nom_fournisseur', ''),
+                'prix_unitaire': round(self.rng.uniform(500, 500000), -2),
+                'quantite_stock': 0,
+                'date_ajout': self._date(),
+            })
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(1, count + 1):
+            total += 1 / rank
+            self.cum_weights.append(total)
+
+    def _pick_products(self, k: int) -> list:
+        return self.rng.choices(self.products_list, cum_weights=self.cum_weights, k=k)
+
+    def _entry(self, product: dict, date: datetime) -> dict:
+        supplier = self.rng.choice(self.suppliers)
+        quantity = self.rng.randint(1, 200)
+        product['quantite_stock'] += quantity
+        doc = {
+            'produit_id': product['_id'], 'produit_nom': product['nom'], 'produit_reference': product['reference'],
+            'fournisseur_id': supplier['_id'], 'fournisseur_nom': supplier['nom_fournisseur'],
+            'quantite_entree': quantity, 'prix_achat_unitaire': round(product['prix_unitaire'] * 0.7, -2),
+            'date_entree': date, 'date_saisie': date,
+        }
+        doc['mots_cles'] = search_keys(doc, SEARCH_FIELDS['entrees_stock'])
+        return doc
+
+    def _exit(self, product: dict, date: datetime) -> dict:
+        quantity = self.rng.randint(1, min(150, product['quantite_stock']))
+        product['quantite_stock'] -= quantity
+        doc = {
+            'produit_id': product['_id'], 'produit_nom': product['nom'], 'produit_reference': product['reference'],
+            'quantite_sortie': quantity, 'prix_unitaire': product['prix_unitaire'],
+            'destination': self.rng.choice(DESTINATIONS),
+            'date_sortie': date, 'date_saisie': date,
+        }
+        doc['mots_cles'] = search_keys(doc, SEARCH_FIELDS['sorties_stock'])
+        return doc
+
+    def _movements(self, count: int):
+        """(collection, document) par date croissante : un mouvement par intervalle de days/count, placé au hasard dedans"""
+        step = self.days * 86400 / max(count, 1)
+        start = self.now - timedelta(days=self.days)
+        for i, product in enumerate(self._pick_products(count)):
+            date = start + timedelta(seconds=(i + self.rng.random()) * step)
+            if self.rng.random() < 0.55:
+                yield 'entrees_stock', self._entry(product, date)
+            elif product['quantite_stock'] > 0:  # Sinon pas de sortie : rien en stock à cette date
+                yield 'sorties_stock', self._exit(product, date)
+
+    def movements(self, count: int) -> dict:
+        """Entrées et sorties mêlées (environ 55 % d'entrées) ; retourne le nombre inséré par collection"""
+        counts = self._insert_mixed(self._movements(count))
+        for product in self.products_list:
+            product['mots_cles'] = search_keys(product, SEARCH_FIELDS['produits'])
+        self._insert('produits', self.products_list)
+        return {'entrees_stock': counts.get('entrees_stock', 0), 'sorties_stock': counts.get('sorties_stock', 0)}
+
+    def history(self, count: int) -> int:
+        def docs():
+            for _ in range(count):
+                product = self._pick_products(1)[0]
+                action = self.rng.choice(ACTIONS)
+                doc = {'action': action, 'produit_id': product['_id'], 'details': f"{product['nom']} ({product['reference']})",
+                       'utilisateur_id': self.rng.choice(self.users)['_id'] if self.users else None,
+                       'date_action': self._date()}
+                doc['mots_cles'] = search_keys(doc, SEARCH_FIELDS['historique'])
+                yield doc
+        return self._insert('historique', docs())
+
+
+def generate(products: int = DEFAULT_VOLUMES['products'], suppliers: int = DEFAULT_VOLUMES['suppliers'],
+             users: int = DEFAULT_VOLUMES['users'], movements: int = DEFAULT_VOLUMES['movements'],
+             history: int = DEFAULT_VOLUMES['history'], seed: int = 42, days: int = 730,
+             batch_size: int = 10000, reset: bool = False) -> dict:
+    """Génère le jeu de données dans la base courante ; retourne les volumes et durées par étape"""
+    if reset:
+        for collection in COLLECTIONS:
+            DB[collection].drop()
+    elif DB['produits'].estimated_document_count():
+        raise ValueError(f"La base {database.MONGO_SETTINGS['database']} contient déjà des produits (utiliser reset)")
+    ensure_indexes()
+    generator = Generator(seed=seed, days=days, batch_size=batch_size)
+    summary = {'seed': seed, 'days': days, 'timings_s': {}}
+
+    def step(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        summary['timings_s'][name] = round(time.perf_counter() - start, 2)
+        print(f"{name} : {result if result is not None else 'ok'} ({summary['timings_s'][name]} s)")
+        return result
+
+    step('reference', generator.reference_data, suppliers, users)
+    step('produits', generator.products, products)
+    summary.update(step('mouvements', generator.movements, movements))
+    summary['historique'] = step('historique', generator.history, history)
+    summary['produits'] = products
+    step('cumuls', rebuild_daily_rollups)
+    step('archive', archive_history)
+    step('instantane', take_stock_snapshot)
+    return summary
+
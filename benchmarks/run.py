@@ -0,0 +1,363 @@
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+import database
+from database import (
+    DB, PRODUCT_INDEX, HISTORY_WRITER, log_action, get_kpi, get_stock_by_category, get_history, get_daily_movements,
+    stock_as_of, resolve_references, search_products, search_suppliers, search_categories, search_users,
+    search_entries, search_exits, search_history, get_products_page, get_entries_page, get_exits_page,
+    get_history_page, add_product, add_entry, add_exit, add_entries_bulk, add_exits_bulk, enable_profiling
+)
+
+# ===========================
+# Mesures de performance
+# ===========================
+BENCHMARKS = {}  # nom: (fonction(ctx), itérations par défaut)
+
+def benchmark(name: str, iterations: int = 30):
+    """Enregistre une mesure ; la fonction reçoit le contexte et fait une opération"""
+    def register(func):
+        BENCHMARKS[name] = (func, iterations)
+        return func
+    return register
+
+
+class Context:
+    """Échantillons tirés de la base (graine fixe) et produits jetables pour les écritures.
+
+    Les mesures d'écriture travaillent sur des produits créés pour l'occasion ;
+    cleanup() les supprime avec leurs mouvements, cumuls et historique, de sorte
+    que le jeu de données reste identique d'une exécution à l'autre.
+    """
+    def __init__(self, seed: int = 42, sample_size: int = 200):
+        self.rng = random.Random(seed)
+        self.scratch_ids = []
+        self.checks = {}  # Vérifications de cohérence des mesures concurrentes
+        # Tirage reproductible (contrairement à $sample) : rangs choisis par la graine, parcours par référence
+        count = DB['produits'].count_documents({})
+        ranks = set(self.rng.sample(range(count), min(sample_size, count)))
+        cursor = DB['produits'].find({}, {'nom': 1, 'reference': 1}).sort('reference', 1)
+        self.products = [doc for rank, doc in enumerate(cursor) if rank in ranks]
+        self.suppliers = list(DB['fournisseurs'].find({}, {'nom_fournisseur': 1}).limit(sample_size))
+        self.users = list(DB['utilisateurs'].find({}, {'nom': 1}).limit(sample_size))
+        oldest = DB['entrees_stock'].find_one({}, {'date_entree': 1}, sort=[('date_entree', 1)])
+        self.oldest = oldest['date_entree'] if oldest else datetime.now()
+
+    def product(self) -> dict:
+        return self.rng.choice(self.products)
+
+    def word(self, docs: list, field: str) -> str:
+        return self.rng.choice(docs)[field].split()[0] if docs else ''
+
+    def month(self) -> str:
+        """Mois au hasard dans la période couverte, au format accepté par search_history"""
+        span = max(1, (datetime.now() - self.oldest).days)
+        date = datetime.now() - timedelta(days=self.rng.randrange(span))
+        return date.strftime('%Y-%m')
+
+    def scratch_product(self, stock: int) -> str:
+        product_id = add_product({
+            'nom': 'Produit benchmark', 'reference': f"BENCH-{len(self.scratch_ids)}-{time.time_ns()}",
+            'categorie': '', 'fournisseur': '', 'quantite_stock': stock, 'prix_unitaire': 1000,
+            'date_ajout': datetime.now()
+        })
+        self.scratch_ids.append(product_id)
+        return str(product_id)
+
+    def cleanup(self):
+        HISTORY_WRITER.flush()
+        ids = self.scratch_ids
+        if ids:
+            for collection in ('entrees_stock', 'sorties_stock', 'mouvements_journaliers', 'historique'):
+                DB[collection].delete_many({'produit_id': {'$in': ids + [str(i) for i in ids]}})
+            DB['produits'].delete_many({'_id': {'$in': ids}})
+            for product_id in ids:
+                PRODUCT_INDEX.remove(product_id)
+        self.scratch_ids = []
+
+
+def summarize(durations: list, elapsed: float) -> dict:
+    """Débit et percentiles (rang le plus proche) d'une série de durées en secondes"""
+    values = sorted(d * 1000 for d in durations)
+
+    def percentile(fraction):
+        return round(values[max(0, math.ceil(fraction * len(values)) - 1)], 3) if values else 0.0
+
+    return {
+        'iterations': len(values),
+        'ops_per_s': round(len(values) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(values) / len(values), 3) if values else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(values[-1], 3) if values else 0.0,
+    }
+
+# -----------------------------
+# Lectures
+# -----------------------------
+for _days in database.KPI_WINDOWS:
+    benchmark(f'get_kpi[{_days}j]')(lambda ctx, days=_days: get_kpi(days))
+
+@benchmark('get_stock_by_category')
+def bench_stock_by_category(ctx):
+    get_stock_by_category()
+
+@benchmark('get_history[7j]')
+def bench_history_week(ctx):
+    get_history(since=datetime.now() - timedelta(days=7))
+
+@benchmark('get_history[1an]', iterations=5)
+def bench_history_year(ctx):
+    get_history(filters={'produit_id': ctx.product()['_id']}, since=datetime.now() - timedelta(days=365))
+
+@benchmark('get_daily_movements[30j]')
+def bench_daily_movements(ctx):
+    get_daily_movements(30)
+
+@benchmark('stock_as_of[30j]', iterations=10)
+def bench_stock_as_of_month(ctx):
+    stock_as_of(datetime.now() - timedelta(days=30))
+
+@benchmark('stock_as_of[1an]', iterations=5)
+def bench_stock_as_of_year(ctx):
+    stock_as_of(datetime.now() - timedelta(days=365))
+
+@benchmark('resolve_references[100 lignes]')
+def bench_resolve_references(ctx):
+    rows = get_history_page(page_size=100)['items']
+    for row in rows:
+        row.pop('produit_nom', None)
+    resolve_references(rows)
+
+@benchmark('PRODUCT_INDEX[chargement]', iterations=5)
+def bench_product_index(ctx):
+    PRODUCT_INDEX.clear()
+    PRODUCT_INDEX.products()
+
+# Pagination : première page puis dix pages successives
+PAGES = {
+    'produits': get_products_page,
+    'entrees': get_entries_page,
+    'sorties': get_exits_page,
+    'historique': get_history_page,
+}
+for _name, _page in PAGES.items():
+    benchmark(f'page[{_name}]')(lambda ctx, page=_page: page())
+
+    def _ten_pages(ctx, page=_page):
+        cursor = None
+        for _ in range(10):
+            cursor = page(cursor=cursor)['next_cursor']
+            if not cursor:
+                break
+    benchmark(f'page[{_name}] x10', iterations=10)(_ten_pages)
+
+# -----------------------------
+# Recherche
+# -----------------------------
+@benchmark('search_products[nom]')
+def bench_search_products(ctx):
+    search_products(ctx.product()['nom'])
+
+@benchmark('search_products[référence]')
+def bench_search_products_reference(ctx):
+    search_products(ctx.product()['reference'])
+
+@benchmark('search_suppliers')
+def bench_search_suppliers(ctx):
+    search_suppliers(ctx.word(ctx.suppliers, 'nom_fournisseur'))
+
+@benchmark('search_categories')
+def bench_search_categories(ctx):
+    search_categories('elec')
+
+@benchmark('search_users')
+def bench_search_users(ctx):
+    search_users(ctx.word(ctx.users, 'nom'))
+
+@benchmark('search_entries[produit]')
+def bench_search_entries(ctx):
+    search_entries(ctx.product()['reference'])
+
+@benchmark('search_entries[préfixe court]')
+def bench_search_entries_short_prefix(ctx):
+    search_entries(ctx.product()['nom'][0])  # Ce qu'envoie la recherche après une seule frappe
+
+@benchmark('search_exits[destination]')
+def bench_search_exits(ctx):
+    search_exits(ctx.rng.choice(['vente', 'casse', 'transfert']))
+
+@benchmark('search_history[mot]')
+def bench_search_history(ctx):
+    search_history(ctx.product()['reference'])
+
+@benchmark('search_history[mois]', iterations=10)
+def bench_search_history_month(ctx):
+    search_history(f"sortie {ctx.month()}")
+
+# -----------------------------
+# Écritures (sur produits jetables)
+# -----------------------------
+@benchmark('add_entry', iterations=100)
+def bench_add_entry(ctx):
+    if not ctx.scratch_ids:
+        ctx.scratch_product(0)
+    add_entry({'produit_id': str(ctx.scratch_ids[0]), 'quantite_entree': 10, 'prix_achat_unitaire': 700,
+               'fournisseur_id': str(ctx.suppliers[0]['_id']) if ctx.suppliers else None})
+
+@benchmark('add_exit', iterations=100)
+def bench_add_exit(ctx):
+    if not ctx.scratch_ids:
+        ctx.scratch_product(10**6)
+    add_exit({'produit_id': str(ctx.scratch_ids[0]), 'quantite_sortie': 1, 'destination': 'Vente'})
+
+@benchmark('add_entries_bulk[100]', iterations=10)
+def bench_add_entries_bulk(ctx):
+    if not ctx.scratch_ids:
+        ctx.scratch_product(0)
+    add_entries_bulk([{'produit_id': str(ctx.scratch_ids[0]), 'quantite_entree': 1} for _ in range(100)])
+
+@benchmark('add_exits_bulk[100]', iterations=10)
+def bench_add_exits_bulk(ctx):
+    if not ctx.scratch_ids:
+        ctx.scratch_product(10**6)
+    add_exits_bulk([{'produit_id': str(ctx.scratch_ids[0]), 'quantite_sortie': 1, 'destination': 'Vente'}
+                    for _ in range(100)])
+
+def legacy_add_exit(data: dict):
+    """add_exit d'avant la décrémentation conditionnelle : lecture, contrôle en Python, insertion puis $inc.
+
+    Gardée uniquement comme référence de add_exit[concurrent] (débit et survente).
+    """
+    product = DB['produits'].find_one({'_id': ObjectId(data['produit_id'])})
+    if not product:
+        raise ValueError("Produit introuvable")
+    if product['quantite_stock'] < data['quantite_sortie']:
+        raise ValueError("Stock insuffisant")
+    result = DB['sorties_stock'].insert_one(data)
+    DB['produits'].update_one(
+        {'_id': ObjectId(data['produit_id'])},
+        {'$inc': {'quantite_stock': -data['quantite_sortie']}}
+    )
+    log_action('Sortie stock', data['produit_id'], f"Quantité: {data['quantite_sortie']}")
+    return result.inserted_id
+
+def parallel_exits(product_id: str, exit_func, threads: int, attempts: int) -> dict:
+    """`threads` postes tentent `attempts` sorties unitaires du même produit ; compte et débit"""
+    accepted, refused, lock = [], [], threading.Lock()
+
+    def worker(count):
+        for _ in range(count):
+            try:
+                exit_func({'produit_id': product_id, 'quantite_sortie': 1, 'destination': 'Vente'})
+                outcome = accepted
+            except ValueError:
+                outcome = refused
+            with lock:
+                outcome.append(1)
+
+    workers = [threading.Thread(target=worker, args=(attempts // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    HISTORY_WRITER.flush()
+    return {'accepted': len(accepted), 'refused': len(refused),
+            'ops_per_s': round((len(accepted) + len(refused)) / elapsed, 1) if elapsed else 0.0}
+
+@benchmark('add_exit[concurrent]', iterations=1)
+def bench_concurrent_exits(ctx, threads: int = 16, stock: int = 500, attempts: int = 1000):
+    """Seize postes vident le même produit : aucune sortie ne doit dépasser le stock.
+
+    La même charge est rejouée avec legacy_add_exit ('avant') pour comparer débit et survente.
+    """
+    result = parallel_exits(ctx.scratch_product(stock), add_exit, threads, attempts)
+    oid = ctx.scratch_ids[-1]
+    remaining = DB['produits'].find_one({'_id': oid})['quantite_stock']
+    exits = DB['sorties_stock'].count_documents({'produit_id': oid})
+    before = parallel_exits(ctx.scratch_product(stock), legacy_add_exit, threads, attempts)
+    before['oversold'] = max(0, before['accepted'] - stock)
+    ctx.checks['add_exit[concurrent]'] = {
+        **result, 'remaining_stock': remaining, 'exits': exits, 'avant': before,
+        'speedup': round(result['ops_per_s'] / before['ops_per_s'], 2) if before['ops_per_s'] else None,
+        'ok': remaining >= 0 and exits == result['accepted'] == stock - remaining,
+    }
+
+# -----------------------------
+# Exécution et comparaison
+# -----------------------------
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def run_benchmarks(names=None, iterations: int = None, warmup: int = 2, seed: int = 42, profile: bool = False) -> dict:
+    """Exécute les mesures demandées (toutes par défaut) et retourne le rapport JSON-sérialisable"""
+    profiler = enable_profiling() if profile else None
+    ctx = Context(seed=seed)
+    results = {}
+    try:
+        for name, (func, default_iterations) in BENCHMARKS.items():
+            if names and not any(pattern in name for pattern in names):
+                continue
+            count = iterations or default_iterations
+            for _ in range(warmup if count > 1 else 0):
+                func(ctx)
+            if profiler:
+                profiler.reset()
+            durations = []
+            start = time.perf_counter()
+            for _ in range(count):
+                t0 = time.perf_counter()
+                func(ctx)
+                durations.append(time.perf_counter() - t0)
+            results[name] = summarize(durations, time.perf_counter() - start)
+            if profiler:
+                round_trips = sum(stats['round_trips'] for stats in profiler.report()['functions'].values())
+                results[name]['round_trips'] = round(round_trips / count, 1)
+            ctx.cleanup()
+            print(f"{name:35} p50 {results[name]['p50_ms']:>9} ms  p95 {results[name]['p95_ms']:>9} ms  "
+                  f"{results[name]['ops_per_s']:>8} op/s")
+    finally:
+        ctx.cleanup()
+    return {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'mongodb': DB.command('buildInfo').get('version', ''),
+            'database': database.MONGO_SETTINGS['database'],
+            'seed': seed,
+            'counts': {c: DB[c].estimated_document_count()
+                       for c in ('produits', 'entrees_stock', 'sorties_stock', 'historique', 'historique_archive')},
+        },
+        'results': results,
+        'checks': ctx.checks,
+    }
+
+def save_results(report: dict, path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+def compare_results(before: dict, after: dict, threshold: float = 0.10) -> list:
+    """Lignes (nom, p50 avant, p50 après, ratio p50, ratio p95, régression) des mesures communes"""
+    rows = []
+    for name, old in before['results'].items():
+        new = after['results'].get(name)
+        if not new:
+            continue
+        p50 = new['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 1.0
+        p95 = new['p95_ms'] / old['p95_ms'] if old['p95_ms'] else 1.0
+        rows.append((name, old['p50_ms'], new['p50_ms'], round(p50, 2), round(p95, 2), p50 > 1 + threshold))
+    return rows
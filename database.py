@@ -1,13 +1,560 @@
 import pymongo
+from pymongo import UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+from collections import defaultdict
+import atexit
+import importlib.util
+import math
+import os
+import sys
+import threading
+import time
 from datetime import datetime, timedelta
+import base64
+import re
+import unicodedata
 import bcrypt
-from bson import ObjectId
+from bson import ObjectId, json_util
 
 # -----------------------------
 # Connexion à MongoDB
 # -----------------------------
-CLIENT = pymongo.MongoClient('mongodb://localhost:27017/')
-DB = CLIENT['gestion_stock']
+def _env_int(name: str, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+# Paramètres de connexion, lus dans l'environnement et modifiables par configure()
+MONGO_SETTINGS = {
+    'uri': os.environ.get('STOCK_MONGO_URI', 'mongodb://localhost:27017/'),
+    'database': os.environ.get('STOCK_MONGO_DB', 'gestion_stock'),
+    'maxPoolSize': _env_int('STOCK_MONGO_MAX_POOL', 20),
+    'minPoolSize': _env_int('STOCK_MONGO_MIN_POOL', 0),
+    'maxIdleTimeMS': _env_int('STOCK_MONGO_MAX_IDLE_MS', 300000),
+    'serverSelectionTimeoutMS': _env_int('STOCK_MONGO_SELECTION_TIMEOUT_MS', 5000),
+    'connectTimeoutMS': _env_int('STOCK_MONGO_CONNECT_TIMEOUT_MS', 5000),
+    'socketTimeoutMS': _env_int('STOCK_MONGO_SOCKET_TIMEOUT_MS', None),
+    'compressors': os.environ.get('STOCK_MONGO_COMPRESSORS', 'zstd,snappy,zlib'),
+    'w': os.environ.get('STOCK_MONGO_W'),
+    'readConcernLevel': os.environ.get('STOCK_MONGO_READ_CONCERN'),
+    'readPreference': os.environ.get('STOCK_MONGO_READ_PREFERENCE'),
+}
+
+# Module Python requis par chaque algorithme de compression (zlib est intégré)
+_COMPRESSOR_MODULES = {'zstd': 'zstandard', 'snappy': 'snappy', 'zlib': None}
+
+def _available_compressors(names: str) -> str:
+    """Garde les compresseurs dont la dépendance optionnelle est installée"""
+    kept = []
+    for name in (n.strip() for n in names.split(',') if n.strip()):
+        module = _COMPRESSOR_MODULES.get(name)
+        if name in _COMPRESSOR_MODULES and (module is None or importlib.util.find_spec(module)):
+            kept.append(name)
+    return ','.join(kept)
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Compteurs du pool de connexions, alimentés par les événements pymongo"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stats = {'created': 0, 'closed': 0, 'checked_out': 0, 'max_checked_out': 0,
+                      'checkouts': 0, 'checkout_failures': 0, 'pool_cleared': 0}
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.stats['pool_cleared'] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.stats['created'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.stats['closed'] += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.stats['checkout_failures'] += 1
+
+    def connection_checked_out(self, event):
+        self.stats['checkouts'] += 1
+        self.stats['checked_out'] += 1
+        self.stats['max_checked_out'] = max(self.stats['max_checked_out'], self.stats['checked_out'])
+
+    def connection_checked_in(self, event):
+        self.stats['checked_out'] -= 1
+
+POOL_STATS = PoolStats()
+_client = None
+_client_lock = threading.Lock()
+_event_listeners = []
+
+def _reset_client():
+    global _client, _transactions_supported
+    if _client is not None:
+        _client.close()
+    _client = None
+    _transactions_supported = None
+
+def configure(**settings):
+    """Modifie MONGO_SETTINGS ; le client existant est fermé et recréé au prochain accès"""
+    unknown = set(settings) - set(MONGO_SETTINGS)
+    if unknown:
+        raise ValueError(f"Paramètres de connexion inconnus : {', '.join(sorted(unknown))}")
+    with _client_lock:
+        MONGO_SETTINGS.update(settings)
+        _reset_client()
+
+def add_event_listener(listener):
+    """Ajoute un listener pymongo (monitoring) aux prochains clients créés"""
+    with _client_lock:
+        _event_listeners.append(listener)
+        _reset_client()
+
+def set_client(client, database: str = None):
+    """Injecte un client déjà construit (par ex. un client local de test) à la place de MongoClient"""
+    global _client
+    with _client_lock:
+        _reset_client()
+        _client = client
+        if database:
+            MONGO_SETTINGS['database'] = database
+
+def get_client():
+    """Retourne le client MongoDB, créé au premier appel"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                options = {key: value for key, value in MONGO_SETTINGS.items()
+                           if key not in ('uri', 'database', 'compressors') and value is not None}
+                compressors = _available_compressors(MONGO_SETTINGS['compressors'] or '')
+                if compressors:
+                    options['compressors'] = compressors
+                _client = pymongo.MongoClient(
+                    MONGO_SETTINGS['uri'], appname='gestion_stock',
+                    event_listeners=[POOL_STATS, *_event_listeners], **options
+                )
+    return _client
+
+def get_db():
+    return get_client()[MONGO_SETTINGS['database']]
+
+def close_client():
+    with _client_lock:
+        _reset_client()
+
+def get_pool_stats() -> dict:
+    return dict(POOL_STATS.stats, max_pool_size=MONGO_SETTINGS['maxPoolSize'])
+
+class _LazyDatabase:
+    """Remplace la base globale : chaque accès passe par get_db(), donc aucune connexion à l'import"""
+    def __getitem__(self, name):
+        return get_db()[name]
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+DB = _LazyDatabase()
+
+# -----------------------------
+# Transactions
+# -----------------------------
+_transactions_supported = None
+
+def supports_transactions() -> bool:
+    """Indique si le serveur accepte les transactions (replica set ou cluster shardé)"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = DB.client.admin.command('hello')
+        _transactions_supported = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+    return _transactions_supported
+
+def run_transaction(callback):
+    """Exécute callback(session) dans une transaction si possible, sinon callback(None)"""
+    if not supports_transactions():
+        return callback(None)
+    with DB.client.start_session() as session:
+        return session.with_transaction(callback)
+
+# -----------------------------
+# Verrous entre postes
+# -----------------------------
+# Un verrou est un document `verrou_<nom>` de `meta` : le créer ou reprendre un
+# verrou expiré est une seule écriture, un second poste reçoit DuplicateKeyError.
+_LOCK_OWNER = str(ObjectId())  # Identifie ce processus
+
+def acquire_lock(name: str, ttl: timedelta = timedelta(hours=1)) -> bool:
+    """Prend le verrou `name` ; faux s'il est tenu par un autre poste depuis moins de `ttl`"""
+    now = datetime.now()
+    try:
+        DB['meta'].update_one(
+            {'_id': f'verrou_{name}', '$or': [{'expire': {'$lt': now}}, {'poste': _LOCK_OWNER}]},
+            {'$set': {'expire': now + ttl, 'poste': _LOCK_OWNER}}, upsert=True)
+    except DuplicateKeyError:
+        return False
+    return True
+
+def release_lock(name: str):
+    DB['meta'].delete_one({'_id': f'verrou_{name}', 'poste': _LOCK_OWNER})
+
+# -----------------------------
+# Index
+# -----------------------------
+# Rétention de l'historique : fenêtre chaude dans `historique`, le reste dans
+# `historique_archive`, supprimé après HISTORY_ARCHIVE_TTL_DAYS si défini.
+HISTORY_HOT_DAYS = _env_int('STOCK_HISTORY_HOT_DAYS', 90)
+HISTORY_ARCHIVE_TTL_DAYS = _env_int('STOCK_HISTORY_ARCHIVE_TTL_DAYS', None)
+
+# Index requis par les requêtes de ce module, par collection.
+INDEXES = {
+    'utilisateurs': [
+        pymongo.IndexModel([('email', pymongo.ASCENDING)], unique=True),
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+    ],
+    'fournisseurs': [
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+    ],
+    'categories': [
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+    ],
+    'produits': [
+        pymongo.IndexModel([('reference', pymongo.ASCENDING)], unique=True),
+        pymongo.IndexModel([('categorie', pymongo.ASCENDING)]),
+        pymongo.IndexModel([('quantite_stock', pymongo.ASCENDING)]),
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+    ],
+    'entrees_stock': [
+        pymongo.IndexModel([('produit_id', pymongo.ASCENDING), ('date_entree', pymongo.DESCENDING)]),
+        pymongo.IndexModel([('date_entree', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]),
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+        pymongo.IndexModel([('date_saisie', pymongo.ASCENDING)]),
+        pymongo.IndexModel([('hors_ordre', pymongo.ASCENDING), ('date_saisie', pymongo.ASCENDING)],
+                           partialFilterExpression={'hors_ordre': True}),
+        pymongo.IndexModel([('hors_ordre', pymongo.ASCENDING), ('date_entree', pymongo.ASCENDING)],
+                           partialFilterExpression={'hors_ordre': True}),
+    ],
+    'sorties_stock': [
+        pymongo.IndexModel([('produit_id', pymongo.ASCENDING), ('date_sortie', pymongo.DESCENDING)]),
+        pymongo.IndexModel([('date_sortie', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]),
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+        pymongo.IndexModel([('date_saisie', pymongo.ASCENDING)]),
+        pymongo.IndexModel([('hors_ordre', pymongo.ASCENDING), ('date_saisie', pymongo.ASCENDING)],
+                           partialFilterExpression={'hors_ordre': True}),
+        pymongo.IndexModel([('hors_ordre', pymongo.ASCENDING), ('date_sortie', pymongo.ASCENDING)],
+                           partialFilterExpression={'hors_ordre': True}),
+    ],
+    'stock_snapshots': [
+        pymongo.IndexModel([('date_snapshot', pymongo.DESCENDING)]),
+    ],
+    'stock_snapshot_chunks': [
+        pymongo.IndexModel([('snapshot_id', pymongo.ASCENDING), ('chunk', pymongo.ASCENDING)]),
+        pymongo.IndexModel([('lu_le', pymongo.ASCENDING)]),
+    ],
+    'mouvements_journaliers': [
+        pymongo.IndexModel([('produit_id', pymongo.ASCENDING), ('jour', pymongo.ASCENDING)], unique=True),
+        pymongo.IndexModel([('jour', pymongo.ASCENDING)]),
+    ],
+    'historique': [
+        pymongo.IndexModel([('date_action', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]),
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+    ],
+    'historique_archive': [
+        pymongo.IndexModel([('date_action', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)]),
+        pymongo.IndexModel([('mots_cles', pymongo.ASCENDING)]),
+    ] + ([
+        pymongo.IndexModel([('date_action', pymongo.ASCENDING)], name='date_action_ttl',
+                           expireAfterSeconds=HISTORY_ARCHIVE_TTL_DAYS * 86400)
+    ] if HISTORY_ARCHIVE_TTL_DAYS else []),
+}
+
+# Requêtes représentatives des fonctions de ce module, vérifiées par check_query_plans()
+QUERY_PLANS = [
+    ('authenticate_user', 'utilisateurs', {'email': ''}, None),
+    ('search_entries (période)', 'entrees_stock', {'date_entree': {'$gte': datetime(1970, 1, 1)}}, None),
+    ('search_exits (période)', 'sorties_stock', {'date_sortie': {'$gte': datetime(1970, 1, 1)}}, None),
+    ('get_kpi (cumuls journaliers)', 'mouvements_journaliers', {'jour': {'$gte': datetime(1970, 1, 1)}}, None),
+    ('search_entries', 'entrees_stock', {'mots_cles': re.compile('^a')}, [('date_entree', pymongo.DESCENDING)]),
+    ('search_exits', 'sorties_stock', {'mots_cles': re.compile('^a')}, [('date_sortie', pymongo.DESCENDING)]),
+    ('get_history', 'historique', {}, [('date_action', pymongo.DESCENDING)]),
+    ('search_products', 'produits', {'mots_cles': re.compile('^a')}, None),
+    ('search_history', 'historique', {'mots_cles': re.compile('^a')}, None),
+    ('stock_as_of (saisies)', 'entrees_stock', {'date_saisie': {'$gte': datetime(1970, 1, 1)}}, None),
+    ('stock_as_of (hors ordre)', 'sorties_stock', {'hors_ordre': True, 'date_sortie': {'$gt': datetime(1970, 1, 1)}}, None),
+]
+
+def _index_spec(info: dict) -> tuple:
+    """Réduit une définition d'index à (clés, unique) pour comparaison"""
+    keys = info['key'].items() if hasattr(info['key'], 'items') else info['key']
+    return (tuple((k, v if isinstance(v, str) else int(v)) for k, v in keys), bool(info.get('unique', False)),
+            info.get('expireAfterSeconds'))
+
+def check_indexes() -> dict:
+    """Compare les index existants aux index déclarés dans INDEXES"""
+    report = {}
+    for collection, models in INDEXES.items():
+        existing = DB[collection].index_information()
+        declared = {m.document['name']: m.document for m in models}
+        missing = [name for name in declared if name not in existing]
+        mismatch = [
+            name for name, doc in declared.items()
+            if name in existing and _index_spec(existing[name]) != _index_spec(doc)
+        ]
+        extra = [name for name in existing if name != '_id_' and name not in declared]
+        if missing or mismatch or extra:
+            report[collection] = {'missing': missing, 'mismatch': mismatch, 'extra': extra}
+    return report
+
+def ensure_indexes(drop_extra: bool = False) -> dict:
+    """Crée les index manquants (idempotent) et retourne l'écart restant avec INDEXES.
+
+    Avec drop_extra=True, les index non déclarés (par ex. remplacés par un index composé)
+    sont supprimés.
+    """
+    errors = {}
+    for collection, models in INDEXES.items():
+        existing = DB[collection].index_information()
+        if drop_extra:
+            declared = {m.document['name'] for m in models}
+            for name in existing:
+                if name != '_id_' and name not in declared:
+                    DB[collection].drop_index(name)
+        for model in models:
+            if model.document['name'] in existing:
+                continue
+            try:
+                DB[collection].create_indexes([model])
+            except OperationFailure as e:
+                errors[f"{collection}.{model.document['name']}"] = str(e)
+    return {'drift': check_indexes(), 'errors': errors}
+
+def _plan_stages(plan: dict):
+    """Parcourt récursivement les étapes d'un plan d'exécution"""
+    plan = plan.get('queryPlan', plan)
+    yield plan.get('stage')
+    if 'inputStage' in plan:
+        yield from _plan_stages(plan['inputStage'])
+    for stage in plan.get('inputStages', []):
+        yield from _plan_stages(stage)
+
+def explain_query(collection: str, query: dict, sort=None) -> list:
+    """Retourne les étapes du plan gagnant pour une requête find"""
+    cursor = DB[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    plan = cursor.explain()['queryPlanner']['winningPlan']
+    return [stage for stage in _plan_stages(plan) if stage]
+
+def check_query_plans(plans=None):
+    """Lève une RuntimeError si une requête de QUERY_PLANS passe par un COLLSCAN"""
+    failures = []
+    for label, collection, query, sort in plans or QUERY_PLANS:
+        stages = explain_query(collection, query, sort)
+        if 'COLLSCAN' in stages:
+            failures.append(f"{label} ({collection}): {' <- '.join(stages)}")
+    if failures:
+        raise RuntimeError("Requêtes sans index (COLLSCAN):\n" + "\n".join(failures))
+
+# -----------------------------
+# Profilage des requêtes
+# -----------------------------
+PROFILE_SLOW_MS = _env_int('STOCK_PROFILE_SLOW_MS', 100)
+EXPLAINABLE_COMMANDS = ('find', 'aggregate', 'count', 'distinct')
+_SESSION_FIELDS = ('lsid', 'txnNumber', 'autocommit', 'startTransaction', 'readConcern', 'writeConcern')
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+class QueryProfiler(monitoring.CommandListener):
+    """Mesure chaque commande envoyée au serveur et l'attribue à la fonction de database.py appelante.
+
+    La fonction retenue est la plus externe de database.py dans la pile (par ex.
+    get_products_page plutôt que get_page). Les commandes plus lentes que
+    `slow_ms` sont expliquées (queryPlanner) dans un thread séparé, au plus
+    `max_explains` fois.
+    """
+    def __init__(self, slow_ms: float = PROFILE_SLOW_MS, max_samples: int = 10000, max_explains: int = 50):
+        self.slow_ms = slow_ms
+        self.max_samples = max_samples
+        self.max_explains = max_explains
+        self._pending = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._functions = defaultdict(lambda: {'durations': [], 'count': 0, 'max_ms': 0.0, 'documents': 0,
+                                                   'errors': 0, 'commands': defaultdict(int)})
+            self.slow = []
+
+    @staticmethod
+    def _caller() -> str:
+        caller = None
+        frame = sys._getframe(2)
+        while frame:
+            if frame.f_code.co_filename == __file__:
+                caller = getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)
+            frame = frame.f_back
+        return caller or '(hors database.py)'
+
+    def started(self, event):
+        if getattr(self._local, 'explaining', False):
+            return
+        collection = event.command.get(event.command_name)
+        command = None
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            command = {key: value for key, value in event.command.items()
+                       if not key.startswith('$') and key not in _SESSION_FIELDS}
+        self._pending[event.request_id] = {
+            'caller': self._caller(),
+            'collection': collection if isinstance(collection, str) else '',
+            'operation': event.command_name,
+            'command': command,
+        }
+
+    def succeeded(self, event):
+        pending = self._pending.pop(event.request_id, None)
+        if pending:
+            reply = event.reply or {}
+            cursor = reply.get('cursor', {})
+            documents = len(cursor.get('firstBatch', cursor.get('nextBatch', []))) if cursor else reply.get('n', 0)
+            self._record(pending, event.duration_micros / 1000, documents)
+
+    def failed(self, event):
+        pending = self._pending.pop(event.request_id, None)
+        if pending:
+            self._record(pending, event.duration_micros / 1000, 0, error=True)
+
+    def _record(self, pending: dict, duration_ms: float, documents: int, error: bool = False):
+        with self._lock:
+            stats = self._functions[pending['caller']]
+            stats['count'] += 1
+            stats['documents'] += documents
+            stats['errors'] += error
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['commands'][f"{pending['collection']}.{pending['operation']}"] += 1
+            if len(stats['durations']) < self.max_samples:
+                stats['durations'].append(duration_ms)
+            entry = None
+            if duration_ms >= self.slow_ms and len(self.slow) < self.max_explains:
+                entry = {'function': pending['caller'], 'collection': pending['collection'],
+                         'operation': pending['operation'], 'duration_ms': round(duration_ms, 2),
+                         'date': datetime.now(), 'explain': None}
+                self.slow.append(entry)
+        if entry and pending['command']:
+            threading.Thread(target=self._explain, args=(entry, pending['command']), daemon=True).start()
+
+    def _explain(self, entry: dict, command: dict):
+        self._local.explaining = True  # Les commandes de ce thread ne sont pas profilées
+        try:
+            result = DB.command('explain', command, verbosity='queryPlanner')
+            entry['explain'] = result.get('queryPlanner', result)
+        except PyMongoError as e:
+            entry['explain'] = {'error': str(e)}
+
+    def report(self) -> dict:
+        """Latences par fonction (p50/p95/max en ms), allers-retours et commandes lentes"""
+        with self._lock:
+            functions = {}
+            for name, stats in self._functions.items():
+                durations = sorted(stats['durations'])
+                functions[name] = {
+                    'round_trips': stats['count'],
+                    'p50_ms': round(_percentile(durations, 0.50), 2),
+                    'p95_ms': round(_percentile(durations, 0.95), 2),
+                    'max_ms': round(stats['max_ms'], 2),
+                    'total_ms': round(sum(durations), 2),
+                    'documents': stats['documents'],
+                    'errors': stats['errors'],
+                    'commands': dict(stats['commands']),
+                }
+            return {'slow_ms': self.slow_ms, 'functions': functions, 'slow': [dict(entry) for entry in self.slow]}
+
+    def dump(self, path: str):
+        """Écrit le rapport en JSON (Extended JSON pour les ObjectId et dates)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json_util.dumps(self.report(), indent=2, ensure_ascii=False))
+
+PROFILER = None
+
+def enable_profiling(slow_ms: float = PROFILE_SLOW_MS) -> QueryProfiler:
+    """Active le profilage : les prochains clients créés enregistrent chaque commande"""
+    global PROFILER
+    if PROFILER is None:
+        PROFILER = QueryProfiler(slow_ms=slow_ms)
+        add_event_listener(PROFILER)
+    return PROFILER
+
+def get_profiler():
+    return PROFILER
+
+if os.environ.get('STOCK_PROFILE'):
+    enable_profiling()
+    if os.environ.get('STOCK_PROFILE_OUTPUT'):
+        atexit.register(lambda: PROFILER.dump(os.environ['STOCK_PROFILE_OUTPUT']))
+
+# -----------------------------
+# Cache des collections de référence
+# -----------------------------
+class ReferenceCache:
+    """Cache en lecture des petites collections (catégories, fournisseurs, utilisateurs).
+
+    Pendant `ttl` secondes une lecture ne fait aucune requête. Ensuite, seul le
+    document de versions partagé (collection `meta`) est relu et la collection n'est
+    rechargée que si un poste l'a modifiée entre-temps. Les écritures de ce poste
+    passent par invalidate(), qui vide l'entrée et incrémente la version.
+    """
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'revalidations': 0}
+
+    def get(self, collection: str, loader) -> list:
+        """Documents de `collection` (copies), chargés par loader() si nécessaire"""
+        with self._lock:
+            entry = self._entries.get(collection)
+            now = time.monotonic()
+            if entry and now - entry['checked_at'] < self.ttl:
+                self.stats['hits'] += 1
+                return [dict(doc) for doc in entry['docs']]
+            version = self._versions().get(collection, 0)
+            if entry and entry['version'] == version:
+                self.stats['revalidations'] += 1
+                entry['checked_at'] = now
+                return [dict(doc) for doc in entry['docs']]
+            self.stats['misses'] += 1
+            docs = loader()
+            self._entries[collection] = {'docs': docs, 'version': version, 'checked_at': now}
+            return [dict(doc) for doc in docs]
+
+    def invalidate(self, collection: str):
+        with self._lock:
+            self._entries.pop(collection, None)
+        DB['meta'].update_one({'_id': 'versions'}, {'$inc': {collection: 1}}, upsert=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _versions(self) -> dict:
+        return DB['meta'].find_one({'_id': 'versions'}) or {}
+
+REFERENCE_CACHE = ReferenceCache(ttl=float(os.environ.get('STOCK_CACHE_TTL', 30)))
 
 # -----------------------------
 # Fonctions de hash des mots de passe
@@ -23,11 +570,21 @@ def check_password(password: str, hashed: bytes) -> bool:
 # -----------------------------
 # Utilisateurs / Authentification
 # -----------------------------
+def _require_email(data: dict):
+    if 'email' in data and not data['email']:
+        raise ValueError("L'email est obligatoire")
+
 def add_user(data: dict):
     """Ajoute un utilisateur avec mot de passe hashé"""
+    _require_email(data)
     data['mot_de_passe'] = hash_password(data['mot_de_passe'])
     data['date_creation'] = datetime.now()
-    result = DB['utilisateurs'].insert_one(data)
+    _set_search_keys('utilisateurs', data)
+    try:
+        result = DB['utilisateurs'].insert_one(data)
+    except DuplicateKeyError:
+        raise ValueError(f"Email déjà utilisé : {data['email']}")
+    REFERENCE_CACHE.invalidate('utilisateurs')
     return result.inserted_id
 
 def authenticate_user(email: str, password: str):
@@ -41,18 +598,25 @@ def authenticate_user(email: str, password: str):
 
 def get_all_users():
     """Liste tous les utilisateurs (sans mot de passe)"""
-    return list(DB['utilisateurs'].find({}, {'mot_de_passe': 0}))
+    return REFERENCE_CACHE.get('utilisateurs', lambda: list(DB['utilisateurs'].find({}, {'mot_de_passe': 0})))
 
 def update_user(user_id, data: dict):
     """Met à jour un utilisateur"""
     if 'mot_de_passe' in data and not data['mot_de_passe'].startswith('$2b$'):
         data['mot_de_passe'] = hash_password(data['mot_de_passe'])
-    DB['utilisateurs'].update_one({'_id': ObjectId(user_id)}, {'$set': data})
+    _require_email(data)
+    _set_search_keys('utilisateurs', data, user_id)
+    try:
+        DB['utilisateurs'].update_one({'_id': ObjectId(user_id)}, {'$set': data})
+    except DuplicateKeyError:
+        raise ValueError(f"Email déjà utilisé : {data['email']}")
+    REFERENCE_CACHE.invalidate('utilisateurs')
     log_action('Modification utilisateur', None, f"Utilisateur {data.get('nom', '')}", str(user_id))
 
 def delete_user(user_id):
     """Supprime un utilisateur"""
     DB['utilisateurs'].delete_one({'_id': ObjectId(user_id)})
+    REFERENCE_CACHE.invalidate('utilisateurs')
     log_action('Suppression utilisateur', None, 'Utilisateur supprimé', user_id)
 
 # -----------------------------
@@ -61,96 +625,336 @@ def delete_user(user_id):
 def get_all_products():
     return list(DB['produits'].find())
 
+def get_product(product_id):
+    return DB['produits'].find_one({'_id': ObjectId(product_id)})
+
+def _require_reference(data: dict):
+    if 'reference' in data and not data['reference']:
+        raise ValueError("La référence est obligatoire")
+
 def add_product(data: dict):
-    result = DB['produits'].insert_one(data)
+    _require_reference(data)
+    _set_search_keys('produits', data)
+    try:
+        result = DB['produits'].insert_one(data)
+    except DuplicateKeyError:
+        raise ValueError(f"Référence déjà utilisée : {data['reference']}")
+    PRODUCT_INDEX.upsert(data)
+    PRODUCT_INDEX.bump_version()
     log_action('Ajout produit', result.inserted_id, data['nom'])
     return result.inserted_id
 
 def update_product(product_id, data: dict):
-    DB['produits'].update_one({'_id': ObjectId(product_id)}, {'$set': data})
+    _require_reference(data)
+    _set_search_keys('produits', data, product_id)
+    try:
+        DB['produits'].update_one({'_id': ObjectId(product_id)}, {'$set': data})
+    except DuplicateKeyError:
+        raise ValueError(f"Référence déjà utilisée : {data['reference']}")
+    PRODUCT_INDEX.upsert({**data, '_id': ObjectId(product_id)})
+    PRODUCT_INDEX.bump_version()
+    _rename_product_movements(ObjectId(product_id), data)
     log_action('Modification produit', product_id, f"Produit mis à jour: {data['nom']}")
 
 def delete_product(product_id):
     DB['produits'].delete_one({'_id': ObjectId(product_id)})
+    PRODUCT_INDEX.remove(product_id)
+    PRODUCT_INDEX.bump_version()
     log_action('Suppression produit', product_id, 'Produit supprimé')
 
+# -----------------------------
+# Index mémoire des produits
+# -----------------------------
+class ProductIndex:
+    """Produits indexés par _id, référence et nom normalisé, pour les formulaires.
+
+    Chargé une fois (nom, référence, prix), puis tenu à jour par
+    add/update/delete_product et par apply_change() (change stream) : remplir un
+    combo ou retrouver le produit choisi ne fait aucune requête. Sans change
+    stream (mongod autonome), les écritures des autres postes sont vues comme
+    pour ReferenceCache : après `ttl` secondes, la version `produits` du document
+    de versions est relue et l'index rechargé si un autre poste l'a incrémentée.
+    """
+    FIELDS = ('nom', 'reference', 'prix_unitaire')
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._by_id = None
+        self._by_reference = {}
+        self._by_name = defaultdict(list)
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def _load(self):
+        now = time.monotonic()
+        if self._by_id is not None and now - self._checked_at < self.ttl:
+            return
+        version = (DB['meta'].find_one({'_id': 'versions'}, {'produits': 1}) or {}).get('produits', 0)
+        self._checked_at = now
+        if self._by_id is not None and version == self._version:
+            return
+        self._by_id, self._version = {}, version
+        self._by_reference.clear()
+        self._by_name.clear()
+        for doc in DB['produits'].find({}, dict.fromkeys(self.FIELDS, 1)):
+            self._add(doc)
+
+    def _add(self, doc: dict):
+        product = {'_id': doc['_id'], **{field: doc.get(field, '') for field in self.FIELDS}}
+        self._by_id[product['_id']] = product
+        self._by_reference[product['reference']] = product
+        self._by_name[normalize_text(product['nom'])].append(product)
+
+    def _discard(self, product_id):
+        product = self._by_id.pop(product_id, None)
+        if product:
+            if self._by_reference.get(product['reference']) is product:
+                del self._by_reference[product['reference']]
+            same_name = self._by_name[normalize_text(product['nom'])]
+            same_name[:] = [p for p in same_name if p is not product]
+
+    def products(self) -> list:
+        """Produits triés par nom (copies)"""
+        with self._lock:
+            self._load()
+            return sorted((dict(p) for p in self._by_id.values()), key=lambda p: normalize_text(p['nom']))
+
+    def get(self, product_id):
+        with self._lock:
+            self._load()
+            product = self._by_id.get(_to_object_id(product_id))
+            return dict(product) if product else None
+
+    def by_reference(self, reference: str):
+        with self._lock:
+            self._load()
+            product = self._by_reference.get(reference)
+            return dict(product) if product else None
+
+    def by_name(self, name: str) -> list:
+        """Tous les produits de ce nom (plusieurs produits peuvent le partager)"""
+        with self._lock:
+            self._load()
+            return [dict(p) for p in self._by_name.get(normalize_text(name), [])]
+
+    def upsert(self, doc: dict):
+        with self._lock:
+            if self._by_id is None:
+                return  # Sera lu au premier chargement
+            previous = self._by_id.get(doc['_id'], {})
+            self._discard(doc['_id'])
+            self._add({**previous, **doc})
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._by_id is not None:
+                self._discard(_to_object_id(product_id))
+
+    def bump_version(self):
+        """Signale aux autres postes une écriture de ce poste sur `produits`"""
+        versions = DB['meta'].find_one_and_update(
+            {'_id': 'versions'}, {'$inc': {'produits': 1}}, projection={'produits': 1},
+            upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+        with self._lock:
+            if self._version is not None and versions['produits'] == self._version + 1:
+                self._version += 1  # Aucune autre écriture entre-temps : l'index reste valide
+
+    def apply_change(self, operation: str, product_id: str, document):
+        """Répercute un événement du change stream sur `produits`"""
+        if operation == 'delete' or document is None:
+            self.remove(product_id)
+        else:
+            self.upsert(document)
+
+    def clear(self):
+        with self._lock:
+            self._by_id = self._version = None
+            self._by_reference.clear()
+            self._by_name.clear()
+
+PRODUCT_INDEX = ProductIndex(ttl=float(os.environ.get('STOCK_CACHE_TTL', 30)))
+
 # -----------------------------
 # Fournisseurs
 # -----------------------------
 def get_all_suppliers():
-    return list(DB['fournisseurs'].find())
+    return REFERENCE_CACHE.get('fournisseurs', lambda: list(DB['fournisseurs'].find()))
+
+def get_supplier(supplier_id):
+    return DB['fournisseurs'].find_one({'_id': ObjectId(supplier_id)})
 
 def add_supplier(data: dict):
+    _set_search_keys('fournisseurs', data)
     result = DB['fournisseurs'].insert_one(data)
+    REFERENCE_CACHE.invalidate('fournisseurs')
     log_action('Ajout fournisseur', None, data['nom_fournisseur'])
     return result.inserted_id
 
 def update_supplier(supplier_id, data: dict):
+    _set_search_keys('fournisseurs', data, supplier_id)
     DB['fournisseurs'].update_one({'_id': ObjectId(supplier_id)}, {'$set': data})
+    REFERENCE_CACHE.invalidate('fournisseurs')
     log_action('Modification fournisseur', None, data['nom_fournisseur'])
 
 def delete_supplier(supplier_id):
     DB['fournisseurs'].delete_one({'_id': ObjectId(supplier_id)})
+    REFERENCE_CACHE.invalidate('fournisseurs')
     log_action('Suppression fournisseur', None, 'Fournisseur supprimé')
 
 # -----------------------------
 # Catégories
 # -----------------------------
 def get_all_categories():
-    return list(DB['categories'].find())
+    return REFERENCE_CACHE.get('categories', lambda: list(DB['categories'].find()))
+
+def get_category(category_id):
+    return DB['categories'].find_one({'_id': ObjectId(category_id)})
 
 def add_category(data: dict):
+    _set_search_keys('categories', data)
     result = DB['categories'].insert_one(data)
+    REFERENCE_CACHE.invalidate('categories')
     log_action('Ajout catégorie', None, data['nom_categorie'])
     return result.inserted_id
 
 def update_category(category_id, data: dict):
+    _set_search_keys('categories', data, category_id)
     DB['categories'].update_one({'_id': ObjectId(category_id)}, {'$set': data})
+    REFERENCE_CACHE.invalidate('categories')
     log_action('Modification catégorie', None, data['nom_categorie'])
 
 def delete_category(category_id):
     DB['categories'].delete_one({'_id': ObjectId(category_id)})
+    REFERENCE_CACHE.invalidate('categories')
     log_action('Suppression catégorie', None, 'Catégorie supprimée')
 
 # -----------------------------
 # Entrées / Sorties de stock
 # -----------------------------
+def _supplier_names() -> dict:
+    return {f['_id']: f.get('nom_fournisseur', '') for f in get_all_suppliers()}
+
+def _denormalize_movement(data: dict, product: dict, suppliers: dict = None):
+    """Références en ObjectId et copie du nom/référence du produit (et du fournisseur) sur le mouvement"""
+    data['produit_id'] = product['_id']
+    data['produit_nom'] = product.get('nom', '')
+    data['produit_reference'] = product.get('reference', '')
+    supplier_id = _to_object_id(data.get('fournisseur_id'))
+    if supplier_id:
+        data['fournisseur_id'] = supplier_id
+        data['fournisseur_nom'] = (suppliers if suppliers is not None else _supplier_names()).get(supplier_id, '')
+
+def _rename_product_movements(product_id: ObjectId, data: dict):
+    """Recopie un nouveau nom/une nouvelle référence de produit sur ses mouvements (et leurs mots-clés)"""
+    names = {key: data[field] for key, field in (('produit_nom', 'nom'), ('produit_reference', 'reference')) if field in data}
+    if not names:
+        return
+    for collection in ('entrees_stock', 'sorties_stock'):
+        fields = SEARCH_FIELDS[collection]
+        query = {'produit_id': {'$in': [product_id, str(product_id)]},
+                 '$or': [{key: {'$ne': value}} for key, value in names.items()]}
+        ops = []
+        for doc in DB[collection].find(query, dict.fromkeys(fields, 1)):
+            doc.update(names)
+            ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {**names, 'mots_cles': search_keys(doc, fields)}}))
+            if len(ops) >= 1000:
+                DB[collection].bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            DB[collection].bulk_write(ops, ordered=False)
+
 def add_entry(data: dict):
     """Ajoute une entrée de stock et met à jour la quantité"""
-    result = DB['entrees_stock'].insert_one(data)
-    DB['produits'].update_one(
-        {'_id': ObjectId(data['produit_id'])},
-        {'$inc': {'quantite_stock': data['quantite_entree']}}
+    data.setdefault('date_entree', datetime.now())
+    product_id = ObjectId(data['produit_id'])
+    product = DB['produits'].find_one_and_update(
+        {'_id': product_id},
+        {'$inc': {'quantite_stock': data['quantite_entree']}},
+        projection={'nom': 1, 'reference': 1}
     )
+    if not product:
+        raise ValueError("Produit introuvable")
+    _stamp_entry(data, 'date_entree', datetime.now())  # Après la mise à jour du stock (voir stock_as_of)
+    _denormalize_movement(data, product)
+    _set_search_keys('entrees_stock', data)
+    try:
+        result = DB['entrees_stock'].insert_one(data)
+    except Exception:
+        DB['produits'].update_one({'_id': product_id}, {'$inc': {'quantite_stock': -data['quantite_entree']}})
+        raise
+    _apply_rollups([_entry_rollup(data)])
     log_action('Entrée stock', data['produit_id'], f"Quantité: {data['quantite_entree']}")
     return result.inserted_id
 
 def add_exit(data: dict):
-    """Ajoute une sortie de stock et met à jour la quantité"""
-    product = DB['produits'].find_one({'_id': ObjectId(data['produit_id'])})
-    if not product:
-        raise ValueError("Produit introuvable")
-    if product['quantite_stock'] < data['quantite_sortie']:
-        raise ValueError("Stock insuffisant")
-    result = DB['sorties_stock'].insert_one(data)
-    DB['produits'].update_one(
-        {'_id': ObjectId(data['produit_id'])},
-        {'$inc': {'quantite_stock': -data['quantite_sortie']}}
-    )
-    log_action('Sortie stock', data['produit_id'], f"Quantité: {data['quantite_sortie']}")
-    return result.inserted_id
+    """Ajoute une sortie de stock et met à jour la quantité.
+
+    La vérification du stock et la décrémentation sont une seule opération
+    conditionnelle côté serveur : deux sorties simultanées ne peuvent pas rendre
+    le stock négatif. Sortie et historique sont écrits dans la même transaction.
+    """
+    product_id = ObjectId(data['produit_id'])
+    quantity = data['quantite_sortie']
+    data.setdefault('date_sortie', datetime.now())
+
+    def operation(session):
+        product = DB['produits'].find_one_and_update(
+            {'_id': product_id, 'quantite_stock': {'$gte': quantity}},
+            {'$inc': {'quantite_stock': -quantity}},
+            projection={'nom': 1, 'reference': 1, 'prix_unitaire': 1},
+            session=session
+        )
+        if not product:
+            if not DB['produits'].count_documents({'_id': product_id}, limit=1, session=session):
+                raise ValueError("Produit introuvable")
+            raise ValueError("Stock insuffisant")
+        _stamp_entry(data, 'date_sortie', datetime.now())  # Après la mise à jour du stock (voir stock_as_of)
+        _denormalize_movement(data, product)
+        _set_search_keys('sorties_stock', data)
+        data['prix_unitaire'] = product.get('prix_unitaire', 0)  # Valorisation de la sortie
+        try:
+            result = DB['sorties_stock'].insert_one(data, session=session)
+        except Exception:
+            if session is None:  # Sans transaction : on rétablit le stock
+                DB['produits'].update_one({'_id': product_id}, {'$inc': {'quantite_stock': quantity}})
+            raise
+        _apply_rollups([_exit_rollup(data)], session=session)
+        log_action('Sortie stock', data['produit_id'], f"Quantité: {quantity}", session=session)
+        return result.inserted_id
+
+    return run_transaction(operation)
 
 def delete_entry(entry_id):
-    """Supprime une entrée de stock"""
-    entry = DB['entrees_stock'].find_one({'_id': ObjectId(entry_id)})
-    if not entry:
-        raise ValueError("Entrée introuvable")
-    DB['produits'].update_one(
-        {'_id': ObjectId(entry['produit_id'])},
-        {'$inc': {'quantite_stock': -entry['quantite_entree']}}
-    )
-    DB['entrees_stock'].delete_one({'_id': ObjectId(entry_id)})
-    log_action('Suppression entrée', entry['produit_id'], 'Entrée supprimée')
+    """Supprime une entrée de stock et retire sa quantité du stock.
+
+    Refusé si le stock restant est inférieur à la quantité entrée (déjà sortie).
+    """
+    entry_oid = ObjectId(entry_id)
+
+    def operation(session):
+        entry = DB['entrees_stock'].find_one({'_id': entry_oid}, session=session)
+        if not entry:
+            raise ValueError("Entrée introuvable")
+        product_id = ObjectId(entry['produit_id'])
+        quantity = entry['quantite_entree']
+        product = DB['produits'].find_one_and_update(
+            {'_id': product_id, 'quantite_stock': {'$gte': quantity}},
+            {'$inc': {'quantite_stock': -quantity}},
+            session=session
+        )
+        if not product and DB['produits'].count_documents({'_id': product_id}, limit=1, session=session):
+            raise ValueError("Stock insuffisant pour annuler cette entrée")
+        deleted = DB['entrees_stock'].delete_one({'_id': entry_oid}, session=session).deleted_count
+        if not deleted:
+            if session is None and product:  # Supprimée entre-temps : on rétablit le stock
+                DB['produits'].update_one({'_id': product_id}, {'$inc': {'quantite_stock': quantity}})
+            raise ValueError("Entrée introuvable")
+        _apply_rollups([_entry_rollup(entry, sign=-1)], session=session)
+        log_action('Suppression entrée', entry['produit_id'], 'Entrée supprimée', session=session)
+        return entry
+
+    _correct_snapshots(run_transaction(operation), 'quantite_entree', 1, datetime.now())
 
 def delete_exit(exit_id):
     """Supprime une sortie de stock"""
@@ -162,6 +966,8 @@ def delete_exit(exit_id):
         {'$inc': {'quantite_stock': exit_record['quantite_sortie']}}
     )
     DB['sorties_stock'].delete_one({'_id': ObjectId(exit_id)})
+    _correct_snapshots(exit_record, 'quantite_sortie', -1, datetime.now())
+    _apply_rollups([_exit_rollup(exit_record, sign=-1)])
     log_action('Suppression sortie', exit_record['produit_id'], 'Sortie supprimée')
 
 def get_all_entries():
@@ -170,121 +976,1203 @@ def get_all_entries():
 def get_all_exits():
     return list(DB['sorties_stock'].find())
 
+# -----------------------------
+# Migration des références des mouvements
+# -----------------------------
+REFERENCES_MIGRATION_LOCK = 'migration_references'
+
+def migrate_movement_references(batch_size: int = 1000):
+    """Convertit produit_id / fournisseur_id des mouvements en ObjectId et y copie les noms (et mots-clés).
+
+    Traitement par lots dans l'ordre des _id ; le dernier _id traité est enregistré
+    dans `meta` après chaque lot, donc une migration interrompue reprend où elle
+    s'est arrêtée. Une collection déjà migrée est ignorée (supprimer son document
+    `migration_references_*` pour la reprendre). Lancée au démarrage en
+    arrière-plan : sans elle, les anciens mouvements n'ont ni noms ni mots-clés et
+    la recherche ne les trouve pas. Un seul poste migre (verrou renouvelé à chaque
+    lot). Retourne le nombre de mouvements modifiés par collection, ou None si un
+    autre poste migre déjà.
+    """
+    if not acquire_lock(REFERENCES_MIGRATION_LOCK):
+        return None
+    try:
+        return _migrate_movement_references(batch_size)
+    finally:
+        release_lock(REFERENCES_MIGRATION_LOCK)
+
+def _migrate_movement_references(batch_size: int) -> dict:
+    suppliers = _supplier_names()
+    migrated = {}
+    for collection in ('entrees_stock', 'sorties_stock'):
+        checkpoint_id = f'migration_references_{collection}'
+        checkpoint = DB['meta'].find_one({'_id': checkpoint_id}) or {}
+        if checkpoint.get('termine'):
+            migrated[collection] = 0
+            continue
+        last_id = checkpoint.get('dernier_id')
+        count = 0
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            fields = {'produit_id': 1, 'fournisseur_id': 1, **dict.fromkeys(SEARCH_FIELDS[collection], 1)}
+            batch = list(DB[collection].find(query, fields).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+            product_ids = list({oid for oid in (_to_object_id(doc.get('produit_id')) for doc in batch) if oid})
+            products = {doc['_id']: doc for doc in DB['produits'].find({'_id': {'$in': product_ids}}, {'nom': 1, 'reference': 1})}
+            ops = []
+            for doc in batch:
+                product_id = _to_object_id(doc.get('produit_id'))
+                if not product_id:
+                    continue
+                update = dict(doc)
+                _denormalize_movement(update, products.get(product_id, {'_id': product_id}), suppliers)
+                update['mots_cles'] = search_keys(update, SEARCH_FIELDS[collection])
+                update.pop('_id')
+                ops.append(UpdateOne({'_id': doc['_id']}, {'$set': update}))
+            if ops:
+                count += DB[collection].bulk_write(ops, ordered=False).modified_count
+            last_id = batch[-1]['_id']
+            DB['meta'].update_one({'_id': checkpoint_id}, {'$set': {'dernier_id': last_id}}, upsert=True)
+            acquire_lock(REFERENCES_MIGRATION_LOCK)  # Renouvelle l'expiration
+        DB['meta'].update_one({'_id': checkpoint_id}, {'$set': {'termine': True}}, upsert=True)
+        # Mots-clés recalculés avec SEARCH_FIELDS : ensure_search_keys n'a pas à tout refaire
+        DB['meta'].update_one({'_id': 'mots_cles'}, {'$set': {collection: SEARCH_FIELDS[collection]}}, upsert=True)
+        migrated[collection] = count
+    return migrated
+
+# -----------------------------
+# Cumuls journaliers par produit
+# -----------------------------
+# Un document par produit et par jour dans `mouvements_journaliers`, tenu à jour par
+# les fonctions d'entrée/sortie : les statistiques parcourent jours x produits au
+# lieu de tous les mouvements.
+ROLLUP_FIELDS = ['quantite_entree', 'quantite_sortie', 'valeur_entree', 'valeur_sortie', 'nb_entrees', 'nb_sorties']
+
+def _day(value) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+def _rollup_op(produit_id, date, **increments) -> UpdateOne:
+    return UpdateOne(
+        {'produit_id': ObjectId(produit_id), 'jour': _day(date)},
+        {'$inc': {field: increments.get(field, 0) for field in ROLLUP_FIELDS}},
+        upsert=True
+    )
+
+def _entry_rollup(entry: dict, sign: int = 1) -> UpdateOne:
+    quantity = entry['quantite_entree']
+    return _rollup_op(entry['produit_id'], entry.get('date_entree') or datetime.now(),
+                      quantite_entree=sign * quantity,
+                      valeur_entree=sign * quantity * (entry.get('prix_achat_unitaire') or 0),
+                      nb_entrees=sign)
+
+def _exit_rollup(exit_record: dict, sign: int = 1) -> UpdateOne:
+    quantity = exit_record['quantite_sortie']
+    return _rollup_op(exit_record['produit_id'], exit_record.get('date_sortie') or datetime.now(),
+                      quantite_sortie=sign * quantity,
+                      valeur_sortie=sign * quantity * (exit_record.get('prix_unitaire') or 0),
+                      nb_sorties=sign)
+
+def _apply_rollups(ops: list, session=None):
+    if ops:
+        DB['mouvements_journaliers'].bulk_write(ops, ordered=False, session=session)
+
+def _rollup_backfill_pipeline(date_field: str, quantity_field: str, value_expr, count_field: str) -> list:
+    """Agrège une collection de mouvements par (produit, jour) et l'ajoute aux cumuls"""
+    values = {field: {'$literal': 0} for field in ROLLUP_FIELDS}
+    values.update({
+        quantity_field: '$quantite',
+        quantity_field.replace('quantite', 'valeur'): '$valeur',
+        count_field: '$nb'
+    })
+    return [
+        {'$match': {date_field: {'$type': 'date'}}},
+        {'$group': {
+            '_id': {
+                'produit_id': {'$convert': {'input': '$produit_id', 'to': 'objectId', 'onError': None, 'onNull': None}},
+                'jour': {'$dateFromParts': {'year': {'$year': f'${date_field}'}, 'month': {'$month': f'${date_field}'},
+                                            'day': {'$dayOfMonth': f'${date_field}'}}}
+            },
+            'quantite': {'$sum': f'${quantity_field}'},
+            'valeur': {'$sum': value_expr},
+            'nb': {'$sum': 1}
+        }},
+        {'$match': {'_id.produit_id': {'$ne': None}}},
+        {'$project': {'_id': 0, 'produit_id': '$_id.produit_id', 'jour': '$_id.jour', **values}},
+        {'$merge': {
+            'into': 'mouvements_journaliers',
+            'on': ['produit_id', 'jour'],
+            'whenMatched': [{'$set': {field: {'$add': [f'${field}', f'$$new.{field}']} for field in ROLLUP_FIELDS}}],
+            'whenNotMatched': 'insert'
+        }}
+    ]
+
+ROLLUPS_META_ID = 'cumuls_journaliers'
+_rollups_ready = False
+
+def daily_rollups_ready() -> bool:
+    """Vrai une fois `mouvements_journaliers` construit (rebuild_daily_rollups ou base neuve)"""
+    global _rollups_ready
+    if not _rollups_ready:
+        _rollups_ready = bool(DB['meta'].find_one({'_id': ROLLUPS_META_ID, 'construit': True}, {'_id': 1}))
+    return _rollups_ready
+
+def _mark_rollups_ready():
+    global _rollups_ready
+    DB['meta'].update_one({'_id': ROLLUPS_META_ID}, {'$set': {'construit': True, 'date': datetime.now()}}, upsert=True)
+    _rollups_ready = True
+
+def ensure_daily_rollups() -> bool:
+    """Construit les cumuls d'une base existante qui ne les a pas encore ; vrai si construits ici.
+
+    Sans aucun mouvement, la base est simplement marquée prête. Un seul poste
+    reconstruit à la fois (verrou `cumuls_journaliers`) ; en attendant, get_kpi
+    compte directement les mouvements récents. Un mouvement écrit pendant cette
+    première construction peut être compté deux fois : `maintenance.py
+    rebuild-rollups` au calme le corrige.
+    """
+    if daily_rollups_ready():
+        return False
+    if not DB['entrees_stock'].find_one({}, {'_id': 1}) and not DB['sorties_stock'].find_one({}, {'_id': 1}):
+        _mark_rollups_ready()
+        return False
+    if not acquire_lock(ROLLUPS_META_ID):
+        return False
+    try:
+        if daily_rollups_ready():  # Construits par un autre poste entre-temps
+            return False
+        rebuild_daily_rollups()
+        return True
+    finally:
+        release_lock(ROLLUPS_META_ID)
+
+def rebuild_daily_rollups():
+    """Reconstruit `mouvements_journaliers` à partir de toutes les entrées et sorties (côté serveur)"""
+    DB['mouvements_journaliers'].delete_many({})
+    DB['entrees_stock'].aggregate(_rollup_backfill_pipeline(
+        'date_entree', 'quantite_entree',
+        {'$multiply': ['$quantite_entree', {'$ifNull': ['$prix_achat_unitaire', 0]}]}, 'nb_entrees'))
+    exits_pipeline = _rollup_backfill_pipeline(
+        'date_sortie', 'quantite_sortie',
+        {'$multiply': ['$quantite_sortie', {'$ifNull': ['$prix_unitaire', {'$ifNull': ['$prix_produit', 0]}]}]}, 'nb_sorties')
+    # Anciennes sorties sans prix : valorisées au prix actuel du produit
+    exits_pipeline[1:1] = [
+        {'$lookup': {'from': 'produits', 'let': {'pid': '$produit_id'}, 'pipeline': [
+            {'$match': {'$expr': {'$eq': ['$_id', {'$convert': {'input': '$$pid', 'to': 'objectId', 'onError': None, 'onNull': None}}]}}},
+            {'$project': {'prix_unitaire': 1}}
+        ], 'as': 'produit'}},
+        {'$set': {'prix_produit': {'$first': '$produit.prix_unitaire'}}}
+    ]
+    DB['sorties_stock'].aggregate(exits_pipeline)
+    _mark_rollups_ready()
+    return DB['mouvements_journaliers'].estimated_document_count()
+
+def get_daily_movements(days: int = 30, produit_id=None) -> list:
+    """Totaux par jour (entrées, sorties, valeurs, nombres) sur les `days` derniers jours"""
+    match = {'jour': {'$gte': _day(datetime.now() - timedelta(days=days - 1))}}
+    if produit_id:
+        match['produit_id'] = ObjectId(produit_id)
+    return list(DB['mouvements_journaliers'].aggregate([
+        {'$match': match},
+        {'$group': {'_id': '$jour', **{field: {'$sum': f'${field}'} for field in ROLLUP_FIELDS}}},
+        {'$sort': {'_id': 1}}
+    ]))
+
+# -----------------------------
+# Instantanés de stock
+# -----------------------------
+# Un instantané est un en-tête dans `stock_snapshots` et des lots compacts
+# (listes parallèles produits / quantités) dans `stock_snapshot_chunks`. L'en-tête
+# est écrit en dernier : un instantané interrompu n'est jamais utilisé.
+#
+# Le rejeu suit l'ordre de saisie et non la date métier : chaque mouvement porte
+# `date_saisie`, posée juste après sa mise à jour du stock, et chaque lot garde
+# `lu_le`, l'heure à laquelle ses produits ont été lus. Un mouvement saisi avant
+# `lu_le` est déjà compté dans le lot, les autres sont rejoués. Les heures
+# viennent des postes : leurs horloges doivent être synchronisées (NTP).
+#
+# Un mouvement daté à plus de ENTRY_DATE_TOLERANCE de sa saisie (antidaté ou
+# postdaté) porte `hors_ordre: True`. Les autres sont rejoués par une seule plage
+# de date_saisie entre l'instantané et la date demandée ; les mouvements hors
+# ordre ont leurs propres index partiels.
+SNAPSHOT_CHUNK_SIZE = 20000
+SNAPSHOT_INTERVAL = timedelta(hours=_env_int('STOCK_SNAPSHOT_INTERVAL_HOURS', 24))
+SNAPSHOT_LOCK = 'instantane'
+
+# (collection, champ date, champ quantité, signe sur le stock)
+STOCK_MOVEMENTS = [
+    ('entrees_stock', 'date_entree', 'quantite_entree', 1),
+    ('sorties_stock', 'date_sortie', 'quantite_sortie', -1),
+]
+ENTRY_DATE_TOLERANCE = timedelta(minutes=5)
+
+def _stamp_entry(data: dict, date_field: str, entered_at: datetime):
+    """Pose date_saisie et marque le mouvement hors ordre si sa date métier en est éloignée"""
+    data['date_saisie'] = entered_at
+    if abs(data[date_field] - entered_at) > ENTRY_DATE_TOLERANCE:
+        data['hors_ordre'] = True
+
+def take_stock_snapshot() -> ObjectId:
+    """Enregistre quantite_stock de tous les produits ; retourne l'identifiant de l'instantané.
+
+    Chaque lot est lu par sa propre requête (plage de _id) juste après avoir noté
+    `lu_le` : un curseur unique lirait les produits par avance, avant l'heure notée.
+    """
+    snapshot_id = ObjectId()
+    started_at = datetime.now()
+    chunk, count, last_id = 0, 0, None
+    while True:
+        read_at = datetime.now()
+        query = {'_id': {'$gt': last_id}} if last_id else {}
+        docs = list(DB['produits'].find(query, {'quantite_stock': 1}).sort('_id', 1).limit(SNAPSHOT_CHUNK_SIZE))
+        if not docs:
+            break
+        DB['stock_snapshot_chunks'].insert_one({
+            'snapshot_id': snapshot_id, 'chunk': chunk, 'lu_le': read_at,
+            'produits': [doc['_id'] for doc in docs],
+            'quantites': [doc.get('quantite_stock', 0) for doc in docs]
+        })
+        chunk, count, last_id = chunk + 1, count + len(docs), docs[-1]['_id']
+    DB['stock_snapshots'].insert_one({
+        '_id': snapshot_id, 'debut': started_at, 'date_snapshot': datetime.now(),
+        'nb_chunks': chunk, 'nb_produits': count
+    })
+    return snapshot_id
+
+def take_snapshot_if_due(interval: timedelta = SNAPSHOT_INTERVAL):
+    """Prend un instantané si le dernier date de plus de `interval` ; retourne son id ou None.
+
+    Un seul poste prend l'instantané : les autres trouvent le verrou pris et
+    repartent sans rien faire.
+    """
+    def due():
+        last = DB['stock_snapshots'].find_one({}, {'date_snapshot': 1}, sort=[('date_snapshot', -1)])
+        return not last or datetime.now() - last['date_snapshot'] >= interval
+
+    if not due() or not acquire_lock(SNAPSHOT_LOCK):
+        return None
+    try:
+        return take_stock_snapshot() if due() else None
+    finally:
+        release_lock(SNAPSHOT_LOCK)
+
+def _correct_snapshots(movement: dict, quantity_field: str, sign: int, deleted_at: datetime):
+    """Retire un mouvement supprimé des lots d'instantanés qui l'avaient compté.
+
+    Un lot l'a compté s'il a été lu après sa saisie et avant sa suppression : la
+    quantité du produit y est corrigée sur place, l'instantané reste utilisable.
+    Un lot lu pendant la suppression mais écrit après cette correction la manque.
+    """
+    product_id = _to_object_id(movement.get('produit_id'))
+    if not product_id:
+        return
+    read_window = {'$lt': deleted_at}
+    if movement.get('date_saisie'):
+        read_window['$gt'] = movement['date_saisie']
+    ops = []
+    for chunk in DB['stock_snapshot_chunks'].find({'lu_le': read_window, 'produits': product_id}, {'produits': 1}):
+        position = chunk['produits'].index(product_id)
+        ops.append(UpdateOne({'_id': chunk['_id']}, {'$inc': {f'quantites.{position}': -sign * movement[quantity_field]}}))
+    if ops:
+        DB['stock_snapshot_chunks'].bulk_write(ops, ordered=False)
+
+def _sum_movements(collection: str, quantity_field: str, match: dict) -> list:
+    return list(DB[collection].aggregate([
+        {'$match': match},
+        {'$group': {'_id': '$produit_id', 'delta': {'$sum': f'${quantity_field}'}}}
+    ]))
+
+def stock_as_of(date: datetime) -> dict:
+    """Quantité en stock de chaque produit à la date donnée ({ObjectId produit: quantité}).
+
+    Part de l'instantané le plus proche avant `date` (à défaut, du premier après),
+    y ajoute les mouvements non lus par l'instantané et datés au plus tard de
+    `date`, et retire ceux déjà lus mais datés après `date`. Hors mouvements hors
+    ordre, seuls ceux saisis entre l'instantané et `date` sont lus. Les
+    modifications directes de quantite_stock (formulaire produit) ne sont
+    visibles qu'à partir de l'instantané suivant.
+    """
+    header = (DB['stock_snapshots'].find_one({'date_snapshot': {'$lte': date}}, sort=[('date_snapshot', -1)])
+              or DB['stock_snapshots'].find_one({'date_snapshot': {'$gt': date}}, sort=[('date_snapshot', 1)]))
+    stocks = defaultdict(int)
+    if header is None:
+        for collection, date_field, quantity_field, sign in STOCK_MOVEMENTS:
+            for row in _sum_movements(collection, quantity_field, {date_field: {'$lte': date}}):
+                product_id = _to_object_id(row['_id'])
+                if product_id:
+                    stocks[product_id] += sign * row['delta']
+        return dict(stocks)
+
+    read_at = {}
+    for chunk in DB['stock_snapshot_chunks'].find({'snapshot_id': header['_id']}).sort('chunk', 1):
+        stocks.update(zip(chunk['produits'], chunk['quantites']))
+        read_at.update(dict.fromkeys(chunk['produits'], chunk.get('lu_le', header['date_snapshot'])))
+    first = header.get('debut', header['date_snapshot'])
+    last = header['date_snapshot']
+    # Un mouvement dans l'ordre est saisi à ENTRY_DATE_TOLERANCE près de sa date
+    lowest = min(first, date) - ENTRY_DATE_TOLERANCE
+    highest = max(last, date) + ENTRY_DATE_TOLERANCE
+
+    for collection, date_field, quantity_field, sign in STOCK_MOVEMENTS:
+        # Saisis après la fin de la lecture et datés au plus tard de `date`
+        added = _sum_movements(collection, quantity_field, {date_field: {'$lte': date}, '$or': [
+            {'date_saisie': {'$gte': last, '$lte': highest}, 'hors_ordre': {'$ne': True}},
+            {'hors_ordre': True, 'date_saisie': {'$gte': last}},
+        ]})
+        # Saisis avant le début de la lecture et datés après `date`
+        removed = _sum_movements(collection, quantity_field, {date_field: {'$gt': date}, '$or': [
+            {'date_saisie': {'$gte': lowest, '$lt': first}, 'hors_ordre': {'$ne': True}},
+            {'hors_ordre': True, 'date_saisie': {'$lt': first}},
+        ]})
+        # Saisis pendant la lecture : comparés à l'heure de lecture de leur produit
+        for doc in DB[collection].find({'date_saisie': {'$gte': first, '$lt': last}},
+                                       {'produit_id': 1, date_field: 1, quantity_field: 1, 'date_saisie': 1}):
+            product_id = _to_object_id(doc['produit_id'])
+            counted = product_id in read_at and doc['date_saisie'] < read_at[product_id]
+            if counted and doc[date_field] > date:
+                stocks[product_id] -= sign * doc[quantity_field]
+            elif not counted and doc[date_field] <= date:
+                stocks[product_id] += sign * doc[quantity_field]
+        for rows, factor in ((added, sign), (removed, -sign)):
+            for row in rows:
+                product_id = _to_object_id(row['_id'])
+                if product_id:
+                    stocks[product_id] += factor * row['delta']
+    return dict(stocks)
+
+# -----------------------------
+# Mouvements en masse
+# -----------------------------
+def _movement_error(data: dict, quantity_field: str):
+    """Retourne le motif de rejet d'une ligne de mouvement, None si elle est valide"""
+    if not _to_object_id(data.get('produit_id')):
+        return "Produit invalide"
+    quantity = data.get(quantity_field)
+    if isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or quantity <= 0:
+        return "Quantité invalide"
+    return None
+
+def _insert_lines(collection: str, lines: list, errors: list) -> list:
+    """insert_many non ordonné de [(index, data)] ; retourne les lignes réellement insérées"""
+    if not lines:
+        return []
+    failed = set()
+    try:
+        DB[collection].insert_many([data for _, data in lines], ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get('writeErrors', []):
+            failed.add(write_error['index'])
+            errors.append({'index': lines[write_error['index']][0], 'error': write_error.get('errmsg', 'Erreur d\'écriture')})
+    return [line for i, line in enumerate(lines) if i not in failed]
+
+def _undo_stock(lines: list, inserted: list, quantity_field: str, sign: int):
+    """Annule sur le stock les lignes non écrites par _insert_lines (sign : effet du mouvement)"""
+    if len(inserted) == len(lines):
+        return
+    inserted_indexes = {index for index, _ in inserted}
+    undo = defaultdict(int)
+    for index, data in lines:
+        if index not in inserted_indexes:
+            undo[ObjectId(data['produit_id'])] -= sign * data[quantity_field]
+    DB['produits'].bulk_write(
+        [UpdateOne({'_id': pid}, {'$inc': {'quantite_stock': qty}}) for pid, qty in undo.items()],
+        ordered=False
+    )
+
+def _insert_movements(collection: str, lines: list, errors: list, quantity_field: str, sign: int) -> list:
+    """_insert_lines sur un stock déjà mis à jour : les lignes non écrites en sont retirées.
+
+    Si l'écriture échoue autrement que ligne par ligne (coupure, délai dépassé),
+    seules les lignes présentes en base gardent leur effet, puis l'erreur remonte.
+    """
+    try:
+        inserted = _insert_lines(collection, lines, errors)
+    except Exception:
+        ids = [data['_id'] for _, data in lines if '_id' in data]  # _id posé par insert_many avant l'envoi
+        written = {doc['_id'] for doc in DB[collection].find({'_id': {'$in': ids}}, {'_id': 1})} if ids else set()
+        _undo_stock(lines, [(index, data) for index, data in lines if data.get('_id') in written], quantity_field, sign)
+        raise
+    _undo_stock(lines, inserted, quantity_field, sign)
+    return inserted
+
+def _bulk_result(count: int, inserted: list, errors: list) -> dict:
+    inserted_ids = [None] * count
+    for index, data in inserted:
+        inserted_ids[index] = data['_id']
+    return {'inserted_ids': inserted_ids, 'errors': sorted(errors, key=lambda e: e['index'])}
+
+def add_entries_bulk(entries: list) -> dict:
+    """Ajoute une liste d'entrées de stock en quelques requêtes.
+
+    Les stocks sont mis à jour par un seul bulk_write ($inc groupé par produit),
+    puis les entrées écrites par insert_many (une ligne non écrite est retirée du
+    stock) et l'historique en un lot. Une ligne invalide est
+    rapportée dans 'errors' ({'index', 'error'}) sans bloquer les autres ;
+    'inserted_ids' donne l'identifiant de chaque ligne (None si rejetée).
+    """
+    errors, lines = [], []
+    for index, data in enumerate(entries):
+        error = _movement_error(data, 'quantite_entree')
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            lines.append((index, data))
+    product_ids = list({ObjectId(data['produit_id']) for _, data in lines})
+    existing = {doc['_id']: doc for doc in DB['produits'].find({'_id': {'$in': product_ids}}, {'nom': 1, 'reference': 1})}
+    suppliers = _supplier_names()
+    valid = []
+    for index, data in lines:
+        product = existing.get(ObjectId(data['produit_id']))
+        if product:
+            _denormalize_movement(data, product, suppliers)
+            _set_search_keys('entrees_stock', data)
+            valid.append((index, data))
+        else:
+            errors.append({'index': index, 'error': "Produit introuvable"})
+
+    increments = defaultdict(int)
+    for _, data in valid:
+        data.setdefault('date_entree', datetime.now())
+        increments[ObjectId(data['produit_id'])] += data['quantite_entree']
+    if increments:
+        DB['produits'].bulk_write(
+            [UpdateOne({'_id': pid}, {'$inc': {'quantite_stock': qty}}) for pid, qty in increments.items()],
+            ordered=False
+        )
+    entered_at = datetime.now()  # Après la mise à jour du stock (voir stock_as_of)
+    for _, data in valid:
+        _stamp_entry(data, 'date_entree', entered_at)
+    inserted = _insert_movements('entrees_stock', valid, errors, 'quantite_entree', 1)
+    _apply_rollups([_entry_rollup(data) for _, data in inserted])
+    log_actions([('Entrée stock', data['produit_id'], f"Quantité: {data['quantite_entree']}") for _, data in inserted])
+    return _bulk_result(len(entries), inserted, errors)
+
+BULK_EXIT_RETRIES = 3  # Relectures du stock quand un autre poste l'a modifié pendant add_exits_bulk
+
+def _reserve_exits(lines: list, stock: dict, errors: list) -> tuple:
+    """Réserve les lignes dans leur ordre sur `stock` ; retourne (lignes retenues, total par produit)"""
+    kept, totals = [], defaultdict(int)
+    for index, data in lines:
+        pid = data['produit_id']
+        if stock.get(pid, 0) - totals[pid] < data['quantite_sortie']:
+            errors.append({'index': index, 'error': "Stock insuffisant"})
+        else:
+            totals[pid] += data['quantite_sortie']
+            kept.append((index, data))
+    return kept, totals
+
+def _decrement_exits(totals: dict) -> set:
+    """Décrémente chaque produit de son total s'il reste assez de stock ; retourne les _id décrémentés.
+
+    Un bulk_write non ordonné ne dit pas quelles opérations ont trouvé leur
+    document : les décréments appliqués sont marqués du numéro de lot, relus si
+    besoin, puis le marqueur est retiré pour ne pas rester dans les produits.
+    """
+    batch = ObjectId()
+    result = DB['produits'].bulk_write([
+        UpdateOne({'_id': pid, 'quantite_stock': {'$gte': qty}},
+                  {'$inc': {'quantite_stock': -qty}, '$set': {'dernier_lot': batch}})
+        for pid, qty in totals.items()
+    ], ordered=False)
+    if result.modified_count == len(totals):
+        applied = set(totals)
+    else:
+        applied = {doc['_id'] for doc in DB['produits'].find(
+            {'_id': {'$in': list(totals)}, 'dernier_lot': batch}, {'_id': 1})}
+    if applied:
+        DB['produits'].update_many({'_id': {'$in': list(applied)}, 'dernier_lot': batch},
+                                   {'$unset': {'dernier_lot': ''}})
+    return applied
+
+def add_exits_bulk(exits: list) -> dict:
+    """Ajoute une liste de sorties de stock en quelques requêtes.
+
+    Le stock est réservé dans l'ordre des lignes : une ligne qui dépasse le stock
+    restant est rejetée ("Stock insuffisant") et les suivantes sont traitées. Les
+    décréments sont conditionnels (quantite_stock >= total du produit) ; si un
+    autre poste a changé le stock d'un produit entre la lecture et l'écriture,
+    son stock est relu et la réservation refaite avec les seules lignes qui
+    tiennent encore (BULK_EXIT_RETRIES fois au plus). Même format de résultat
+    que add_entries_bulk.
+    """
+    errors, lines = [], []
+    for index, data in enumerate(exits):
+        error = _movement_error(data, 'quantite_sortie')
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            lines.append((index, data))
+    product_ids = list({ObjectId(data['produit_id']) for _, data in lines})
+    products = {doc['_id']: doc for doc in DB['produits'].find(
+        {'_id': {'$in': product_ids}}, {'quantite_stock': 1, 'prix_unitaire': 1, 'nom': 1, 'reference': 1})}
+    pending = []
+    for index, data in lines:
+        product = products.get(ObjectId(data['produit_id']))
+        if not product:
+            errors.append({'index': index, 'error': "Produit introuvable"})
+            continue
+        data.setdefault('date_sortie', datetime.now())
+        data['prix_unitaire'] = product.get('prix_unitaire', 0)
+        _denormalize_movement(data, product, {})
+        _set_search_keys('sorties_stock', data)
+        pending.append((index, data))
+
+    stock = {pid: doc.get('quantite_stock', 0) for pid, doc in products.items()}
+    accepted = []
+    for attempt in range(BULK_EXIT_RETRIES + 1):
+        if attempt:
+            # Stock modifié entre la lecture et l'écriture : relecture des seuls produits concernés
+            stock = {doc['_id']: doc.get('quantite_stock', 0) for doc in DB['produits'].find(
+                {'_id': {'$in': list({data['produit_id'] for _, data in pending})}}, {'quantite_stock': 1})}
+        kept, totals = _reserve_exits(pending, stock, errors)
+        if not totals:
+            pending = []
+            break
+        applied = _decrement_exits(totals)
+        accepted += [(index, data) for index, data in kept if data['produit_id'] in applied]
+        pending = [(index, data) for index, data in kept if data['produit_id'] not in applied]
+        if not pending:
+            break
+    errors += [{'index': index, 'error': "Stock insuffisant"} for index, _ in pending]
+    if not accepted:
+        return _bulk_result(len(exits), [], errors)
+    accepted.sort(key=lambda line: line[0])
+
+    entered_at = datetime.now()  # Après la mise à jour du stock (voir stock_as_of)
+    for _, data in accepted:
+        _stamp_entry(data, 'date_sortie', entered_at)
+    inserted = _insert_movements('sorties_stock', accepted, errors, 'quantite_sortie', -1)  # Sorties non écrites : quantité rendue
+    _apply_rollups([_exit_rollup(data) for _, data in inserted])
+    log_actions([('Sortie stock', data['produit_id'], f"Quantité: {data['quantite_sortie']}") for _, data in inserted])
+    return _bulk_result(len(exits), inserted, errors)
+
 # -----------------------------
 # Historique
 # -----------------------------
-def log_action(action: str, produit_id=None, details: str='', user_id=None):
-    """Ajoute une entrée dans l'historique"""
-    DB['historique'].insert_one({
+def _history_doc(action: str, produit_id=None, details: str='', user_id=None) -> dict:
+    doc = {
         'action': action,
         'produit_id': produit_id,
         'utilisateur_id': user_id,
         'details': details,
         'date_action': datetime.now()
-    })
+    }
+    doc['mots_cles'] = search_keys(doc, SEARCH_FIELDS['historique'])
+    return doc
+
+class HistoryWriter:
+    """File d'attente en mémoire pour l'historique.
+
+    Les entrées sont écrites par insert_many(ordered=False) depuis un thread de fond
+    dès que `max_batch` entrées sont en attente, et au plus tard après `max_delay`
+    secondes. En mode synchrone (tests), chaque entrée est écrite immédiatement.
+    """
+    def __init__(self, max_batch: int = 500, max_delay: float = 1.0, synchronous: bool = False):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.synchronous = synchronous
+        self._queue = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._stats = {'written': 0, 'flushes': 0, 'errors': 0,
+                       'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0}
+
+    def write(self, doc: dict):
+        self.write_many([doc])
+
+    def write_many(self, docs: list):
+        if not docs:
+            return
+        if self.synchronous or self._closed:
+            DB['historique'].insert_many(docs, ordered=False)
+            self._stats['written'] += len(docs)
+            return
+        with self._lock:
+            self._queue.extend(docs)
+            full = len(self._queue) >= self.max_batch
+        self._start()
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Écrit immédiatement les entrées en attente ; retourne leur nombre"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return 0
+            start = time.perf_counter()
+            try:
+                DB['historique'].insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Doublons d'une tentative précédente partiellement écrite : ignorés
+                self._stats['errors'] += sum(1 for err in e.details.get('writeErrors', []) if err.get('code') != 11000)
+            except PyMongoError:
+                self._stats['errors'] += 1
+                with self._lock:
+                    self._queue[:0] = batch  # Nouvel essai au prochain vidage
+                raise
+            elapsed = (time.perf_counter() - start) * 1000
+            self._stats['written'] += len(batch)
+            self._stats['flushes'] += 1
+            self._stats['last_flush_ms'] = elapsed
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed)
+            self._stats['total_flush_ms'] += elapsed
+            return len(batch)
+
+    def close(self):
+        """Arrête le thread de fond et écrit ce qui reste (appelé à la sortie)"""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
 
-def get_history(filters=None):
-    query = filters or {}
-    return list(DB['historique'].find(query).sort('date_action', -1))
+    def get_stats(self) -> dict:
+        stats = dict(self._stats, queue_depth=self.queue_depth)
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.max_delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except PyMongoError:
+                pass  # Compté dans les stats, réessayé au tour suivant
+
+HISTORY_WRITER = HistoryWriter(synchronous=os.environ.get('STOCK_HISTORY_SYNC') == '1')
+atexit.register(HISTORY_WRITER.close)
+
+def log_action(action: str, produit_id=None, details: str='', user_id=None, session=None):
+    """Ajoute une entrée dans l'historique.
+
+    Dans une transaction (`session`), l'entrée est écrite avec elle ; sinon elle
+    passe par HISTORY_WRITER.
+    """
+    doc = _history_doc(action, produit_id, details, user_id)
+    if session is not None:
+        DB['historique'].insert_one(doc, session=session)
+    else:
+        HISTORY_WRITER.write(doc)
+
+def log_actions(actions: list):
+    """Ajoute un lot d'entrées (action, produit_id, details[, user_id]) dans l'historique"""
+    HISTORY_WRITER.write_many([_history_doc(*action) for action in actions])
+
+def _history_spans_archive(since) -> bool:
+    """Une requête commençant à `since` (None = sans borne) peut-elle viser des entrées archivées ?"""
+    return since is None or since < datetime.now() - timedelta(days=HISTORY_HOT_DAYS)
+
+def get_history(filters=None, since: datetime = None, until: datetime = None):
+    """Historique trié du plus récent au plus ancien.
+
+    Sans borne de dates, seule la fenêtre chaude (`historique`) est lue ; si `since`
+    remonte avant HISTORY_HOT_DAYS, l'archive est incluse dans la même requête.
+    """
+    HISTORY_WRITER.flush()
+    query = dict(filters or {})
+    if since is None and until is None:
+        return list(DB['historique'].find(query).sort('date_action', -1))
+    query['date_action'] = {key: value for key, value in (('$gte', since), ('$lt', until)) if value}
+    pipeline = [{'$match': query}]
+    if _history_spans_archive(since):
+        pipeline.append({'$unionWith': {'coll': 'historique_archive', 'pipeline': [{'$match': query}]}})
+    pipeline.append({'$sort': {'date_action': -1, '_id': -1}})
+    return list(DB['historique'].aggregate(pipeline))
+
+HISTORY_ARCHIVE_LOCK = 'archivage_historique'
+
+def archive_history(hot_days: int = HISTORY_HOT_DAYS, batch_size: int = 1000):
+    """Déplace par lots les entrées plus anciennes que `hot_days` vers `historique_archive`.
+
+    Reprise sans perte après interruption : un lot déjà copié mais pas encore
+    supprimé est simplement recopié (doublons ignorés) puis supprimé. Lancé
+    périodiquement par l'application ; un seul poste archive (verrou renouvelé à
+    chaque lot). Retourne le nombre d'entrées déplacées, ou None si un autre
+    poste archive déjà.
+    """
+    if not acquire_lock(HISTORY_ARCHIVE_LOCK):
+        return None
+    try:
+        return _archive_history(hot_days, batch_size)
+    finally:
+        release_lock(HISTORY_ARCHIVE_LOCK)
+
+def _archive_history(hot_days: int, batch_size: int) -> int:
+    HISTORY_WRITER.flush()
+    cutoff = datetime.now() - timedelta(days=hot_days)
+    moved = 0
+    while True:
+        batch = list(DB['historique'].find({'date_action': {'$lt': cutoff}}).sort('date_action', 1).limit(batch_size))
+        if not batch:
+            return moved
+        try:
+            DB['historique_archive'].insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+        DB['historique'].delete_many({'_id': {'$in': [doc['_id'] for doc in batch]}})
+        moved += len(batch)
+        acquire_lock(HISTORY_ARCHIVE_LOCK)  # Renouvelle l'expiration
 
 def delete_history(history_id):
-    """Supprime une entrée d'historique"""
-    DB['historique'].delete_one({'_id': ObjectId(history_id)})
+    """Supprime une entrée d'historique, récente ou archivée (search_history renvoie les deux)"""
+    history_oid = ObjectId(history_id)
+    if not DB['historique'].delete_one({'_id': history_oid}).deleted_count:
+        if not DB['historique_archive'].delete_one({'_id': history_oid}).deleted_count:
+            raise ValueError("Entrée d'historique introuvable")
     log_action('Suppression historique', None, 'Entrée d\'historique supprimée')
 
+# -----------------------------
+# Pagination (keyset sur (clé de tri, _id))
+# -----------------------------
+DEFAULT_PAGE_SIZE = 100
+
+def _encode_cursor(value, last_id) -> str:
+    """Encode la position de la dernière ligne d'une page en jeton opaque"""
+    return base64.urlsafe_b64encode(json_util.dumps({'v': value, 'id': last_id}).encode()).decode()
+
+def _decode_cursor(token: str):
+    data = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    return data['v'], data['id']
+
+def _keyset_filter(sort_key, direction, value, last_id) -> dict:
+    """Filtre des documents situés après (value, last_id) dans l'ordre de tri"""
+    op = '$lt' if direction == pymongo.DESCENDING else '$gt'
+    if sort_key == '_id':
+        return {'_id': {op: last_id}}
+    branches = [{sort_key: value, '_id': {op: last_id}}]
+    if value is None:
+        # Les valeurs absentes sont triées en premier : en ordre croissant, tout le reste suit
+        if direction == pymongo.ASCENDING:
+            branches.append({sort_key: {'$ne': None}})
+    else:
+        branches.append({sort_key: {op: value}})
+        if direction == pymongo.DESCENDING:
+            branches.append({sort_key: None})
+    return {'$or': branches}
+
+def get_page(collection: str, sort_key: str = '_id', direction=pymongo.DESCENDING,
+             page_size: int = DEFAULT_PAGE_SIZE, cursor: str = None, query: dict = None,
+             projection: dict = None, with_total: bool = False) -> dict:
+    """Retourne une page de documents triés sur (sort_key, _id).
+
+    Le résultat contient 'items', 'next_cursor' (jeton à repasser pour la page
+    suivante, None à la fin) et, si with_total, 'total' (nombre de documents filtrés).
+    """
+    base = dict(query or {})
+    find_query = base
+    if cursor:
+        keyset = _keyset_filter(sort_key, direction, *_decode_cursor(cursor))
+        find_query = {'$and': [base, keyset]} if base else keyset
+    sort = [('_id', direction)] if sort_key == '_id' else [(sort_key, direction), ('_id', direction)]
+    items = list(DB[collection].find(find_query, projection).sort(sort).limit(page_size + 1))
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    page = {
+        'items': items,
+        'next_cursor': _encode_cursor(items[-1].get(sort_key), items[-1]['_id']) if has_more else None
+    }
+    if with_total:
+        page['total'] = DB[collection].count_documents(base) if base else DB[collection].estimated_document_count()
+    return page
+
+def get_products_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, with_total=False):
+    return get_page('produits', '_id', pymongo.ASCENDING, page_size, cursor, with_total=with_total)
+
+def get_suppliers_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, with_total=False):
+    return get_page('fournisseurs', '_id', pymongo.ASCENDING, page_size, cursor, with_total=with_total)
+
+def get_categories_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, with_total=False):
+    return get_page('categories', '_id', pymongo.ASCENDING, page_size, cursor, with_total=with_total)
+
+def get_users_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, with_total=False):
+    return get_page('utilisateurs', '_id', pymongo.ASCENDING, page_size, cursor,
+                    projection={'mot_de_passe': 0}, with_total=with_total)
+
+def get_entries_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, with_total=False):
+    return get_page('entrees_stock', 'date_entree', pymongo.DESCENDING, page_size, cursor, with_total=with_total)
+
+def get_exits_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, with_total=False):
+    return get_page('sorties_stock', 'date_sortie', pymongo.DESCENDING, page_size, cursor, with_total=with_total)
+
+def get_history_page(cursor=None, page_size=DEFAULT_PAGE_SIZE, with_total=False, filters=None):
+    HISTORY_WRITER.flush()
+    return get_page('historique', 'date_action', pymongo.DESCENDING, page_size, cursor,
+                    query=filters, with_total=with_total)
+
 # -----------------------------
 # Tableau de bord / KPI
 # -----------------------------
-def get_kpi():
-    total_prods = DB['produits'].count_documents({})
-    rupture = DB['produits'].count_documents({'quantite_stock': 0})
-    recent_entries = DB['entrees_stock'].count_documents({'date_entree': {'$gte': datetime.now() - timedelta(days=30)}})
-    recent_exits = DB['sorties_stock'].count_documents({'date_sortie': {'$gte': datetime.now() - timedelta(days=30)}})
-    return {
-        'total_prods': total_prods,
-        'rupture': rupture,
-        'recent_entries': recent_entries,
-        'recent_exits': recent_exits
+LOW_STOCK_THRESHOLD = 50  # Seuil d'alerte "stock faible"
+KPI_WINDOWS = (7, 30, 90)  # Fenêtres proposées pour les mouvements récents (jours)
+
+def get_kpi(days: int = 30, low_stock_threshold: int = LOW_STOCK_THRESHOLD):
+    """Calcule tous les compteurs du tableau de bord en une seule agrégation.
+
+    Les mouvements récents sont comptés sur les `days` derniers jours calendaires,
+    à partir des cumuls journaliers, ou directement dans les mouvements tant que
+    ceux-ci ne sont pas construits (base existante, voir ensure_daily_rollups).
+    Le champ 'timings' donne la durée de la requête et du calcul complet en
+    millisecondes.
+    """
+    if days <= 0:
+        raise ValueError("La fenêtre doit être d'au moins un jour")
+    start = time.perf_counter()
+    since = _day(datetime.now() - timedelta(days=days - 1))
+    pipeline = [
+        {'$group': {
+            '_id': 'produits',
+            'total_prods': {'$sum': 1},
+            'rupture': {'$sum': {'$cond': [{'$eq': ['$quantite_stock', 0]}, 1, 0]}},
+            # $isNumber : comme le filtre {'$lt': seuil} de count_low_stock_products(), un stock absent ne compte pas
+            'stock_faible': {'$sum': {'$cond': [{'$and': [
+                {'$isNumber': '$quantite_stock'}, {'$lt': ['$quantite_stock', low_stock_threshold]}
+            ]}, 1, 0]}},
+            'valeur_stock': {'$sum': {'$multiply': [
+                {'$ifNull': ['$quantite_stock', 0]},
+                {'$ifNull': ['$prix_unitaire', 0]}
+            ]}}
+        }},
+    ]
+    if daily_rollups_ready():
+        pipeline.append({'$unionWith': {'coll': 'mouvements_journaliers', 'pipeline': [
+            {'$match': {'jour': {'$gte': since}}},
+            {'$group': {'_id': 'mouvements', 'recent_entries': {'$sum': '$nb_entrees'},
+                        'recent_exits': {'$sum': '$nb_sorties'}}}
+        ]}})
+    else:
+        for collection, date_field, counter in (('entrees_stock', 'date_entree', 'recent_entries'),
+                                                ('sorties_stock', 'date_sortie', 'recent_exits')):
+            pipeline.append({'$unionWith': {'coll': collection, 'pipeline': [
+                {'$match': {date_field: {'$gte': since}}},
+                {'$group': {'_id': collection, counter: {'$sum': 1}}}
+            ]}})
+    rows = {row['_id']: row for row in DB['produits'].aggregate(pipeline)}
+    query_ms = (time.perf_counter() - start) * 1000
+    produits = rows.pop('produits', {})
+    kpi = {
+        'total_prods': produits.get('total_prods', 0),
+        'rupture': produits.get('rupture', 0),
+        'stock_faible': produits.get('stock_faible', 0),
+        'valeur_stock': produits.get('valeur_stock', 0),
+        'recent_entries': sum(row.get('recent_entries', 0) for row in rows.values()),
+        'recent_exits': sum(row.get('recent_exits', 0) for row in rows.values()),
+        'days': days
     }
+    kpi['timings'] = {'query_ms': query_ms, 'total_ms': (time.perf_counter() - start) * 1000}
+    return kpi
+
+def get_low_stock_products(threshold: int = LOW_STOCK_THRESHOLD, limit: int = 0):
+    """Produits sous le seuil, du stock le plus bas au plus haut (index quantite_stock)"""
+    cursor = DB['produits'].find({'quantite_stock': {'$lt': threshold}},
+                                 projection={'nom': 1, 'reference': 1, 'quantite_stock': 1},
+                                 sort=[('quantite_stock', pymongo.ASCENDING)], limit=limit)
+    return list(cursor)
+
+def count_low_stock_products(threshold: int = LOW_STOCK_THRESHOLD) -> int:
+    return DB['produits'].count_documents({'quantite_stock': {'$lt': threshold}})
 
 def get_stock_by_category():
-    """Retourne la quantité totale par catégorie"""
-    categories = get_all_categories()
+    """Retourne quantité totale, nombre de produits et valeur du stock par catégorie.
+
+    Une seule agrégation : les catégories sans produit apparaissent à zéro et les
+    produits dont la catégorie n'existe plus sont conservés sous leur propre libellé.
+    """
+    pipeline = [
+        {'$group': {
+            '_id': {'$ifNull': ['$categorie', '']},
+            'quantite': {'$sum': '$quantite_stock'},
+            'nb_produits': {'$sum': 1},
+            'valeur': {'$sum': {'$multiply': [
+                {'$ifNull': ['$quantite_stock', 0]},
+                {'$ifNull': ['$prix_unitaire', 0]}
+            ]}}
+        }},
+        {'$unionWith': {'coll': 'categories', 'pipeline': [
+            {'$project': {'_id': '$nom_categorie', 'quantite': {'$literal': 0},
+                          'nb_produits': {'$literal': 0}, 'valeur': {'$literal': 0}}}
+        ]}},
+        {'$group': {
+            '_id': '$_id',
+            'quantite': {'$sum': '$quantite'},
+            'nb_produits': {'$sum': '$nb_produits'},
+            'valeur': {'$sum': '$valeur'}
+        }},
+        {'$sort': {'_id': 1}}
+    ]
     stock_data = {}
-    for cat in categories:
-        total = sum(p['quantite_stock'] for p in DB['produits'].find({'categorie': cat['nom_categorie']}))
-        stock_data[cat['nom_categorie']] = total
+    for row in DB['produits'].aggregate(pipeline):
+        stock_data[row['_id'] or 'Sans catégorie'] = {
+            'quantite': row['quantite'],
+            'nb_produits': row['nb_produits'],
+            'valeur': row['valeur']
+        }
     return stock_data
 
+# -----------------------------
+# Résolution des références
+# -----------------------------
+# (champ référence, collection référencée, champ lu, champ ajouté à la ligne)
+REFERENCES = [
+    ('produit_id', 'produits', 'nom', 'produit_nom'),
+    ('utilisateur_id', 'utilisateurs', 'role', 'role'),
+    ('fournisseur_id', 'fournisseurs', 'nom_fournisseur', 'fournisseur_nom'),
+]
+REFERENCE_BATCH_SIZE = 10000
+
+def _to_object_id(value):
+    """Convertit une référence (ObjectId ou chaîne) en ObjectId, None si invalide"""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+def resolve_references(rows: list, fields=None) -> list:
+    """Complète les lignes avec produit_nom / role / fournisseur_nom.
+
+    Chaque collection référencée est lue une seule fois ($in sur les identifiants
+    distincts, projection minimale) : le coût dépend du nombre de documents
+    référencés, pas du nombre de lignes. Les lignes qui portent déjà la valeur
+    (mouvements avec nom dénormalisé) ne sont pas relues. `fields` restreint les
+    champs à résoudre.
+    """
+    for id_field, collection, source, target in REFERENCES:
+        if fields is not None and target not in fields:
+            continue
+        pending = [row for row in rows if not row.get(target)]
+        ids = {oid for oid in (_to_object_id(row.get(id_field)) for row in pending) if oid}
+        values = {}
+        id_list = list(ids)
+        for i in range(0, len(id_list), REFERENCE_BATCH_SIZE):
+            batch = id_list[i:i + REFERENCE_BATCH_SIZE]
+            for doc in DB[collection].find({'_id': {'$in': batch}}, {source: 1}):
+                values[str(doc['_id'])] = doc.get(source, '')
+        for row in pending:
+            if row.get(id_field):
+                row[target] = values.get(str(row[id_field]), '')
+            else:
+                row.setdefault(target, '')
+    return rows
+
 # -----------------------------
 # Fonctions de Recherche
 # -----------------------------
+# Les documents portent un champ indexé `mots_cles` : les mots de ces champs, en
+# minuscules et sans accents. Une recherche est une suite de préfixes ancrés sur ce
+# champ, ce qui permet d'utiliser l'index et neutralise les caractères spéciaux.
+SEARCH_FIELDS = {
+    'produits': ['nom', 'reference', 'categorie'],
+    'fournisseurs': ['nom_fournisseur', 'email'],
+    'categories': ['nom_categorie'],
+    'utilisateurs': ['nom', 'prenom', 'email'],
+    'historique': ['action', 'details'],
+    # Mouvements : noms recopiés du produit et du fournisseur (_denormalize_movement)
+    'entrees_stock': ['produit_nom', 'produit_reference', 'fournisseur_nom'],
+    'sorties_stock': ['produit_nom', 'produit_reference', 'destination'],
+}
+SEARCH_LIMIT = 200
+_WORD_RE = re.compile(r'\w+')
+
+def normalize_text(text) -> str:
+    """Minuscules sans accents ("Électronique" -> "electronique")"""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def search_keys(doc: dict, fields: list) -> list:
+    """Mots normalisés et distincts des champs `fields` d'un document"""
+    words = set()
+    for field in fields:
+        if doc.get(field):
+            words.update(_WORD_RE.findall(normalize_text(doc[field])))
+    return sorted(words)
+
+def _set_search_keys(collection: str, data: dict, doc_id=None):
+    """Calcule `mots_cles` pour un ajout ou une mise à jour ($set partiel complété depuis la base)"""
+    fields = SEARCH_FIELDS[collection]
+    source = data
+    if doc_id is not None and not all(field in data for field in fields):
+        current = DB[collection].find_one({'_id': ObjectId(doc_id)}, {field: 1 for field in fields}) or {}
+        source = {**current, **data}
+    data['mots_cles'] = search_keys(source, fields)
+
+def _ranked_search(collection: str, query: str, projection: dict = None, sort: dict = None,
+                   limit: int = SEARCH_LIMIT, match: dict = None, union_with: str = None):
+    """Recherche par préfixes sur `mots_cles`, classée par nombre de mots exacts, limitée côté serveur.
+
+    `match` ajoute des conditions ; `union_with` étend la recherche à une seconde
+    collection de même forme (archive).
+    """
+    terms = _WORD_RE.findall(normalize_text(query))
+    clauses = [{'mots_cles': re.compile('^' + re.escape(term))} for term in terms]
+    if match:
+        clauses.append(match)
+    if not clauses:
+        return []
+    pipeline = [{'$match': {'$and': clauses}}]
+    if union_with:
+        pipeline.append({'$unionWith': {'coll': union_with, 'pipeline': [{'$match': {'$and': clauses}}]}})
+    pipeline += [
+        {'$addFields': {'_score': {'$size': {'$setIntersection': [{'$ifNull': ['$mots_cles', []]}, terms]}}}},
+        {'$sort': {'_score': -1, **(sort or {}), '_id': 1}},
+        {'$limit': limit},
+        {'$project': {'_score': 0, 'mots_cles': 0, **(projection or {})}}
+    ]
+    return list(DB[collection].aggregate(pipeline))
+
+# Mouvements : "2025-10" (un mois), "2025-10-01" (un jour) ou "2025-10-01..2025-10-15"
+_DATE_TOKEN_RE = re.compile(r'^(\d{4}-\d{2}(?:-\d{2})?)(?:\.\.(\d{4}-\d{2}(?:-\d{2})?))?$')
+
+def _period(text: str):
+    """Début et fin (exclue) du mois "AAAA-MM" ou du jour "AAAA-MM-JJ" """
+    parts = [int(part) for part in text.split('-')]
+    if len(parts) == 2:
+        start = datetime(parts[0], parts[1], 1)
+        end = datetime(parts[0] + parts[1] // 12, parts[1] % 12 + 1, 1)
+    else:
+        start = datetime(*parts)
+        end = start + timedelta(days=1)
+    return start, end
+
+def parse_date_range(token: str):
+    """Intervalle [début, fin) d'un jeton de date, None si le jeton n'en est pas un.
+
+    Les bornes d'un intervalle saisi à l'envers ("2025-10-15..2025-10-01") sont
+    remises dans l'ordre.
+    """
+    match = _DATE_TOKEN_RE.match(token)
+    if not match:
+        return None
+    try:
+        periods = [_period(text) for text in match.groups() if text]
+    except ValueError:  # Date impossible, par ex. 2025-13
+        return None
+    return min(start for start, _ in periods), max(end for _, end in periods)
+
+def _date_clause(date_field: str, periods: list) -> dict:
+    """Condition sur `date_field` : dans l'une des périodes (plusieurs jetons de date = union)"""
+    ranges = [{date_field: {'$gte': start, '$lt': end}} for start, end in periods]
+    return ranges[0] if len(ranges) == 1 else {'$or': ranges}
+
+def _movement_search(collection: str, date_field: str, query: str, limit: int = SEARCH_LIMIT):
+    """Recherche de mouvements par mots (produit, fournisseur ou destination) et par période.
+
+    Les mots sont des préfixes sur les `mots_cles` du mouvement (copiés du
+    produit à l'écriture) ; les jetons de date deviennent des intervalles sur
+    `date_field`. Résultat trié du plus récent au plus ancien.
+    """
+    clauses, periods = [], []
+    for token in query.split():
+        period = parse_date_range(token)
+        if period:
+            periods.append(period)
+        else:
+            clauses += [{'mots_cles': re.compile('^' + re.escape(word))} for word in _WORD_RE.findall(normalize_text(token))]
+    if periods:
+        clauses.append(_date_clause(date_field, periods))
+    if not clauses:
+        return []
+    return list(DB[collection].find({'$and': clauses}, {'mots_cles': 0}).sort(date_field, -1).limit(limit))
+
+SEARCH_KEYS_LOCK = 'mots_cles'
+
+def ensure_search_keys(batch_size: int = 1000, rebuild: bool = False) -> int:
+    """Calcule `mots_cles` pour les documents qui ne l'ont pas ; retourne le nombre mis à jour.
+
+    Une collection dont la liste SEARCH_FIELDS a changé depuis le dernier passage
+    (enregistrée dans `meta`) est entièrement recalculée, comme avec rebuild.
+    Sur une grosse base c'est long : un seul poste le fait (verrou renouvelé à
+    chaque lot), les autres retournent 0 tout de suite.
+    """
+    if not acquire_lock(SEARCH_KEYS_LOCK):
+        return 0
+    try:
+        updated = 0
+        done = DB['meta'].find_one({'_id': 'mots_cles'}) or {}
+        for collection, fields in SEARCH_FIELDS.items():
+            query = {} if rebuild or done.get(collection) != fields else {'mots_cles': {'$exists': False}}
+            ops = []
+            for doc in DB[collection].find(query, {field: 1 for field in fields}):
+                ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'mots_cles': search_keys(doc, fields)}}))
+                if len(ops) >= batch_size:
+                    updated += DB[collection].bulk_write(ops, ordered=False).modified_count
+                    ops = []
+                    acquire_lock(SEARCH_KEYS_LOCK)  # Renouvelle l'expiration
+            if ops:
+                updated += DB[collection].bulk_write(ops, ordered=False).modified_count
+            if done.get(collection) != fields:
+                DB['meta'].update_one({'_id': 'mots_cles'}, {'$set': {collection: fields}}, upsert=True)
+        return updated
+    finally:
+        release_lock(SEARCH_KEYS_LOCK)
+
 def search_products(query: str):
     if not query:
         return get_all_products()
-    return list(DB['produits'].find({
-        '$or': [
-            {'nom': {'$regex': query, '$options': 'i'}},
-            {'reference': {'$regex': query, '$options': 'i'}},
-            {'categorie': {'$regex': query, '$options': 'i'}}
-        ]
-    }))
+    return _ranked_search('produits', query)
 
 def search_suppliers(query: str):
     if not query:
         return get_all_suppliers()
-    return list(DB['fournisseurs'].find({
-        '$or': [
-            {'nom_fournisseur': {'$regex': query, '$options': 'i'}},
-            {'email': {'$regex': query, '$options': 'i'}}
-        ]
-    }))
+    return _ranked_search('fournisseurs', query)
 
 def search_categories(query: str):
     if not query:
         return get_all_categories()
-    return list(DB['categories'].find({'nom_categorie': {'$regex': query, '$options': 'i'}}))
+    return _ranked_search('categories', query)
 
 def search_entries(query: str):
     if not query:
         return get_all_entries()
-    return list(DB['entrees_stock'].find({
-        '$or': [
-            {'produit_id': {'$regex': query, '$options': 'i'}},
-            {'date_entree': {'$regex': query, '$options': 'i'}}
-        ]
-    }))
+    return _movement_search('entrees_stock', 'date_entree', query)
 
 def search_exits(query: str):
     if not query:
         return get_all_exits()
-    return list(DB['sorties_stock'].find({
-        '$or': [
-            {'produit_id': {'$regex': query, '$options': 'i'}},
-            {'destination': {'$regex': query, '$options': 'i'}}
-        ]
-    }))
+    return _movement_search('sorties_stock', 'date_sortie', query)
 
 def search_history(query: str):
+    """Recherche par mots et par période ("2025-10", "2025-01-01..2025-03-31").
+
+    Plusieurs périodes se cumulent (entrée de l'une ou de l'autre). Une période
+    qui remonte au-delà de la fenêtre chaude inclut l'archive.
+    """
     if not query:
         return get_history()
-    return list(DB['historique'].find({
-        '$or': [
-            {'action': {'$regex': query, '$options': 'i'}},
-            {'details': {'$regex': query, '$options': 'i'}}
-        ]
-    }).sort('date_action', -1))
+    HISTORY_WRITER.flush()
+    words, periods = [], []
+    for token in query.split():
+        period = parse_date_range(token)
+        if period:
+            periods.append(period)
+        else:
+            words.append(token)
+    if not words and not periods:
+        return []
+    match = _date_clause('date_action', periods) if periods else None
+    union = 'historique_archive' if periods and _history_spans_archive(min(start for start, _ in periods)) else None
+    return _ranked_search('historique', ' '.join(words), sort={'date_action': -1}, match=match, union_with=union)
 
 def search_users(query: str):
     if not query:
         return get_all_users()
-    return list(DB['utilisateurs'].find({
-        '$or': [
-            {'nom': {'$regex': query, '$options': 'i'}},
-            {'prenom': {'$regex': query, '$options': 'i'}},
-            {'email': {'$regex': query, '$options': 'i'}}
-        ]
-    }, {'mot_de_passe': 0}))
+    return _ranked_search('utilisateurs', query, projection={'mot_de_passe': 0})
 
 def get_user(user_id):
     """Récupère un utilisateur par son ID"""
@@ -1,11 +1,19 @@
 import sys
+import threading
+import time
 from datetime import datetime
 from PySide6.QtWidgets import QApplication, QDialog,QStyleFactory
-from database import DB, hash_password
+from database import (
+    DB, hash_password, ensure_indexes, ensure_search_keys, ensure_daily_rollups, take_snapshot_if_due,
+    migrate_movement_references, archive_history
+)
+from pymongo.errors import PyMongoError
 from ui.login import LoginDialog
 from ui.main_window import MainWindow
 import os
 
+MAINTENANCE_PERIOD_S = int(os.environ.get('STOCK_MAINTENANCE_PERIOD_MINUTES', 60)) * 60
+
 # -------------------------------
 # Variables d'environnement pour Linux (éviter les segfaults graphiques)
 # -------------------------------
@@ -17,6 +25,15 @@ if __name__ == '__main__':
     # Créer QApplication
     app = QApplication(sys.argv)
     
+    # ===========================
+    # Index MongoDB
+    # ===========================
+    index_report = ensure_indexes()
+    for name, error in index_report['errors'].items():
+        print(f"Index {name} non créé : {error}")
+    for collection, drift in index_report['drift'].items():
+        print(f"Index {collection} non conformes : {drift}")
+    
     # ===========================
     # Création d'un utilisateur test si la DB est vide
     # ===========================
@@ -47,6 +64,26 @@ if __name__ == '__main__':
             'date_ajout': datetime.now()
         })
     
+    # En arrière-plan, chaque tâche sous verrou (un seul poste à la fois) :
+    # noms et mots-clés des mouvements d'une base antérieure, mots-clés de
+    # recherche des documents créés hors de l'application, cumuls journaliers
+    # (get_kpi compte les mouvements en attendant) ; puis, tant que l'application
+    # tourne, toutes les MAINTENANCE_PERIOD_S secondes : instantané de stock s'il
+    # est dû et archivage de l'historique sorti de la fenêtre chaude
+    def background_maintenance():
+        migrate_movement_references()
+        ensure_search_keys()
+        ensure_daily_rollups()
+        while True:
+            for task in (take_snapshot_if_due, archive_history):
+                try:
+                    task()
+                except PyMongoError as e:
+                    print(f"Maintenance ({task.__name__}) impossible : {e}")
+            time.sleep(MAINTENANCE_PERIOD_S)
+
+    threading.Thread(target=background_maintenance, daemon=True).start()
+    
     # ===========================
     # Login
     # ===========================
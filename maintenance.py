@@ -0,0 +1,84 @@
+import argparse
+import sys
+from database import (
+    ensure_indexes, rebuild_daily_rollups, take_stock_snapshot, archive_history, HISTORY_HOT_DAYS,
+    migrate_movement_references, check_query_plans, acquire_lock, release_lock, SNAPSHOT_LOCK, ensure_search_keys
+)
+
+# ===========================
+# Tâches de maintenance de la base
+# ===========================
+def cmd_rebuild_rollups(args):
+    ensure_indexes()
+    count = rebuild_daily_rollups()
+    print(f"Cumuls journaliers reconstruits : {count} documents")
+
+def cmd_snapshot(args):
+    if not acquire_lock(SNAPSHOT_LOCK):
+        print("Un instantané est déjà en cours sur un autre poste")
+        sys.exit(1)
+    try:
+        snapshot_id = take_stock_snapshot()
+    finally:
+        release_lock(SNAPSHOT_LOCK)
+    print(f"Instantané de stock enregistré : {snapshot_id}")
+
+def cmd_archive_history(args):
+    ensure_indexes()
+    moved = archive_history(hot_days=args.hot_days, batch_size=args.batch_size)
+    if moved is None:
+        print("Un archivage est déjà en cours sur un autre poste")
+        sys.exit(1)
+    print(f"Entrées d'historique archivées : {moved}")
+
+def cmd_migrate_references(args):
+    migrated = migrate_movement_references(batch_size=args.batch_size)
+    if migrated is None:
+        print("Une migration est déjà en cours sur un autre poste")
+        sys.exit(1)
+    for collection, count in migrated.items():
+        print(f"{collection} : {count} mouvements migrés")
+
+def cmd_search_keys(args):
+    updated = ensure_search_keys(batch_size=args.batch_size, rebuild=args.rebuild)
+    print(f"Mots-clés de recherche mis à jour : {updated} documents")
+
+def cmd_check_plans(args):
+    report = ensure_indexes()
+    for name, error in report['errors'].items():
+        print(f"Index {name} non créé : {error}")
+    try:
+        check_query_plans()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    print("Toutes les requêtes vérifiées utilisent un index")
+
+# nom: (fonction, aide, arguments)
+COMMANDS = {
+    'rebuild-rollups': (cmd_rebuild_rollups, "Reconstruit les cumuls journaliers à partir des mouvements", []),
+    'snapshot': (cmd_snapshot, "Enregistre un instantané des quantités en stock", []),
+    'archive-history': (cmd_archive_history, "Déplace l'historique ancien vers historique_archive", [
+        ('--hot-days', {'type': int, 'default': HISTORY_HOT_DAYS, 'help': "Jours conservés dans historique"}),
+        ('--batch-size', {'type': int, 'default': 1000, 'help': "Entrées déplacées par lot"}),
+    ]),
+    'migrate-references': (cmd_migrate_references, "Convertit les références des mouvements en ObjectId et copie les noms", [
+        ('--batch-size', {'type': int, 'default': 1000, 'help': "Mouvements traités par lot"}),
+    ]),
+    'search-keys': (cmd_search_keys, "Calcule les mots-clés de recherche manquants ou périmés", [
+        ('--batch-size', {'type': int, 'default': 1000, 'help': "Documents mis à jour par lot"}),
+        ('--rebuild', {'action': 'store_true', 'help': "Recalcule tous les documents"}),
+    ]),
+    'check-plans': (cmd_check_plans, "Échoue si une requête de QUERY_PLANS passe par un COLLSCAN", []),
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintenance de la base gestion_stock")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (func, help_text, arguments) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flag, options in arguments:
+            subparser.add_argument(flag, **options)
+        subparser.set_defaults(func=func)
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,38 @@
+import threading
+import mongomock
+import pytest
+import database
+
+# Le serveur applique chaque mise à jour d'un document de façon atomique ; mongomock
+# lit puis réécrit le document sans verrou. Ce verrou rétablit la garantie du serveur
+# pour que les tests concurrents portent sur le code et non sur le simulateur.
+_WRITE_LOCK = threading.RLock()
+_ATOMIC_METHODS = ('find_one_and_update', 'update_one', 'update_many', 'bulk_write')
+
+def _atomic(method):
+    def wrapper(*args, **kwargs):
+        with _WRITE_LOCK:
+            return method(*args, **kwargs)
+    return wrapper
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch):
+    """Base mongomock vide, sans transactions, historique écrit immédiatement"""
+    for name in _ATOMIC_METHODS:
+        monkeypatch.setattr(mongomock.Collection, name, _atomic(getattr(mongomock.Collection, name)))
+    database.set_client(mongomock.MongoClient(), 'gestion_stock_test')
+    monkeypatch.setattr(database, '_transactions_supported', False)
+    monkeypatch.setattr(database.HISTORY_WRITER, 'synchronous', True)
+    database.PRODUCT_INDEX.clear()
+    database.REFERENCE_CACHE.clear()
+    yield database.DB
+    database.close_client()
+
+@pytest.fixture
+def product(db):
+    """Crée un produit et retourne son _id (str)"""
+    def create(stock: int = 0, **fields):
+        data = {'nom': 'Produit test', 'reference': f"T{db['produits'].count_documents({})}",
+                'categorie': '', 'fournisseur': '', 'quantite_stock': stock, 'prix_unitaire': 100, **fields}
+        return str(database.add_product(data))
+    return create
@@ -0,0 +1,52 @@
+import threading
+import mongomock
+from bson import ObjectId
+from database import add_exit
+from benchmarks.run import Context, bench_concurrent_exits, legacy_add_exit, parallel_exits
+
+def stock_of(db, product_id):
+    return db['produits'].find_one({'_id': ObjectId(product_id)})['quantite_stock']
+
+def test_parallel_exits_never_oversell(db, product):
+    """Contrôle et décrément conditionnels en une écriture : la garantie vient de
+    l'atomicité du serveur, reproduite ici par le verrou de conftest (_WRITE_LOCK)"""
+    product_id = product(stock=50)
+    result = parallel_exits(product_id, add_exit, threads=10, attempts=200)
+    assert result['accepted'] == 50
+    assert result['refused'] == 150
+    assert stock_of(db, product_id) == 0
+    assert db['sorties_stock'].count_documents({'produit_id': ObjectId(product_id)}) == 50
+
+def test_legacy_read_then_decrement_oversells(db, product, monkeypatch):
+    """Deux postes lisent le stock avant que l'un d'eux ne le décrémente"""
+    product_id = product(stock=1)
+    barrier = threading.Barrier(2, timeout=5)
+    find_one = mongomock.Collection.find_one
+    waited = threading.local()
+
+    def find_one_then_wait(self, *args, **kwargs):
+        doc = find_one(self, *args, **kwargs)
+        if self.name == 'produits' and threading.current_thread() is not threading.main_thread() \
+                and not getattr(waited, 'done', False):
+            waited.done = True  # Seule la lecture du contrôle de stock attend l'autre poste
+            barrier.wait()
+        return doc
+
+    monkeypatch.setattr(mongomock.Collection, 'find_one', find_one_then_wait)
+    result = parallel_exits(product_id, legacy_add_exit, threads=2, attempts=2)
+    assert result['accepted'] == 2
+    assert stock_of(db, product_id) == -1
+
+def test_concurrent_benchmark_compares_before_and_after(db):
+    """Forme du rapport seulement : mongomock sérialise les écritures, le débit n'y
+    est pas représentatif et ne se compare qu'avec `python -m benchmarks run` sur un serveur"""
+    ctx = Context()
+    try:
+        bench_concurrent_exits(ctx, threads=4, stock=40, attempts=100)
+    finally:
+        ctx.cleanup()
+    check = ctx.checks['add_exit[concurrent]']
+    assert check['ok']
+    assert check['accepted'] == 40 and check['remaining_stock'] == 0
+    assert check['avant']['accepted'] + check['avant']['refused'] == 100
+    assert {'ops_per_s', 'speedup'} <= set(check) and 'ops_per_s' in check['avant']
@@ -0,0 +1,58 @@
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+import database
+from database import add_entries_bulk, add_exits_bulk
+
+def test_exits_bulk_leaves_no_batch_marker(db, product):
+    product_id = product(stock=10)
+    result = add_exits_bulk([{'produit_id': product_id, 'quantite_sortie': 4},
+                             {'produit_id': product_id, 'quantite_sortie': 9}])
+    assert result['errors'] == [{'index': 1, 'error': "Stock insuffisant"}]
+    doc = db['produits'].find_one({'_id': ObjectId(product_id)})
+    assert doc['quantite_stock'] == 6
+    assert 'dernier_lot' not in doc
+
+def test_exits_bulk_retries_lines_that_still_fit(db, product, monkeypatch):
+    """Un autre poste sort 5 unités entre la lecture et l'écriture du lot"""
+    product_id = product(stock=10)
+    decrement = database._decrement_exits
+    calls = []
+
+    def concurrent_exit_then_decrement(totals):
+        if not calls:
+            db['produits'].update_one({'_id': ObjectId(product_id)}, {'$inc': {'quantite_stock': -5}})
+        calls.append(dict(totals))
+        return decrement(totals)
+
+    monkeypatch.setattr(database, '_decrement_exits', concurrent_exit_then_decrement)
+    result = add_exits_bulk([{'produit_id': product_id, 'quantite_sortie': 3},
+                             {'produit_id': product_id, 'quantite_sortie': 4},
+                             {'produit_id': product_id, 'quantite_sortie': 2}])
+    assert len(calls) == 2  # Lot complet (9) refusé, puis 3 + 2 sur les 5 restants
+    assert result['errors'] == [{'index': 1, 'error': "Stock insuffisant"}]
+    assert result['inserted_ids'][0] and result['inserted_ids'][2]
+    doc = db['produits'].find_one({'_id': ObjectId(product_id)})
+    assert doc['quantite_stock'] == 0
+    assert 'dernier_lot' not in doc
+    assert db['sorties_stock'].count_documents({'produit_id': ObjectId(product_id)}) == 2
+
+@pytest.mark.parametrize('bulk, quantity_field, start, expected', [
+    (add_entries_bulk, 'quantite_entree', 0, 2),  # Seule la première entrée (2) est écrite
+    (add_exits_bulk, 'quantite_sortie', 10, 8),   # Seule la première sortie (2) est écrite
+])
+def test_bulk_keeps_stock_of_written_lines_when_connection_drops(db, product, monkeypatch,
+                                                                 bulk, quantity_field, start, expected):
+    product_id = product(stock=start)
+    insert_many = mongomock.Collection.insert_many
+
+    def first_then_disconnect(self, documents, *args, **kwargs):
+        documents = list(documents)
+        insert_many(self, documents[:1], *args, **kwargs)
+        raise AutoReconnect("connexion perdue")
+
+    monkeypatch.setattr(mongomock.Collection, 'insert_many', first_then_disconnect)
+    with pytest.raises(AutoReconnect):
+        bulk([{'produit_id': product_id, quantity_field: 2}, {'produit_id': product_id, quantity_field: 3}])
+    assert db['produits'].find_one({'_id': ObjectId(product_id)})['quantite_stock'] == expected
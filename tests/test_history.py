@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from database import delete_history, archive_history, HISTORY_ARCHIVE_LOCK
+
+def test_delete_history_falls_back_to_archive(db):
+    archived_id = db['historique_archive'].insert_one({
+        'action': 'Entrée stock', 'details': 'Quantité: 3', 'date_action': datetime.now() - timedelta(days=200)
+    }).inserted_id
+    delete_history(str(archived_id))
+    assert db['historique_archive'].count_documents({'_id': archived_id}) == 0
+    assert db['historique'].count_documents({'action': 'Suppression historique'}) == 1
+
+def test_delete_unknown_history_is_refused(db):
+    with pytest.raises(ValueError):
+        delete_history(str(ObjectId()))
+    assert db['historique'].count_documents({'action': 'Suppression historique'}) == 0
+
+
+def test_archive_history_moves_old_entries_and_releases_lock(db):
+    old = datetime.now() - timedelta(days=200)
+    db['historique'].insert_many([{'action': 'Entrée stock', 'date_action': old} for _ in range(3)]
+                                 + [{'action': 'Sortie stock', 'date_action': datetime.now()}])
+    assert archive_history(batch_size=2) == 3
+    assert db['historique'].count_documents({}) == 1
+    assert db['historique_archive'].count_documents({}) == 3
+    assert db['meta'].count_documents({'_id': f'verrou_{HISTORY_ARCHIVE_LOCK}'}) == 0
+
+def test_archive_history_skips_when_locked(db):
+    db['meta'].insert_one({'_id': f'verrou_{HISTORY_ARCHIVE_LOCK}', 'poste': 'autre',
+                           'expire': datetime.now() + timedelta(hours=1)})
+    db['historique'].insert_one({'action': 'Entrée stock', 'date_action': datetime.now() - timedelta(days=200)})
+    assert archive_history() is None
+    assert db['historique'].count_documents({}) == 1
@@ -0,0 +1,38 @@
+from datetime import datetime
+import pytest
+from bson import ObjectId
+import database
+from database import migrate_movement_references
+
+def test_interrupted_migration_resumes_after_last_batch(db, product, monkeypatch):
+    product_id = product(nom='Perceuse')
+    supplier_id = db['fournisseurs'].insert_one({'nom_fournisseur': 'Outils SA'}).inserted_id
+    db['entrees_stock'].insert_many([
+        {'produit_id': product_id, 'fournisseur_id': str(supplier_id), 'quantite_entree': i + 1, 'date_entree': datetime.now()}
+        for i in range(5)
+    ])
+    bulk_write = type(db['entrees_stock']).bulk_write
+    batches = []
+
+    def fail_on_third_batch(self, requests, *args, **kwargs):
+        if self.name == 'entrees_stock':
+            batches.append(len(requests))
+            if len(batches) == 3:
+                raise RuntimeError("coupure")
+        return bulk_write(self, requests, *args, **kwargs)
+
+    monkeypatch.setattr(type(db['entrees_stock']), 'bulk_write', fail_on_third_batch)
+    with pytest.raises(RuntimeError):
+        migrate_movement_references(batch_size=2)
+    checkpoint = db['meta'].find_one({'_id': 'migration_references_entrees_stock'})
+    ids = [doc['_id'] for doc in db['entrees_stock'].find().sort('_id', 1)]
+    assert checkpoint['dernier_id'] == ids[3] and not checkpoint.get('termine')
+
+    batches.clear()
+    assert migrate_movement_references(batch_size=2) == {'entrees_stock': 1, 'sorties_stock': 0}
+    assert batches == [1]  # Seul le dernier mouvement restait à migrer
+    for entry in db['entrees_stock'].find():
+        assert entry['produit_id'] == ObjectId(product_id) and entry['produit_nom'] == 'Perceuse'
+        assert entry['fournisseur_id'] == supplier_id and entry['fournisseur_nom'] == 'Outils SA'
+    assert db['meta'].find_one({'_id': 'migration_references_entrees_stock'})['termine']
+    assert db['meta'].find_one({'_id': f'verrou_{database.REFERENCES_MIGRATION_LOCK}'}) is None
@@ -0,0 +1,22 @@
+from datetime import datetime
+import pymongo
+import pytest
+from database import get_page
+
+@pytest.mark.parametrize('direction', [pymongo.DESCENDING, pymongo.ASCENDING])
+def test_pages_visit_every_document_once(db, direction):
+    """Dates égales, nulles et absentes : chaque document apparaît une fois, dans l'ordre du tri"""
+    dates = [datetime(2025, 1, 1), datetime(2025, 1, 2), None]
+    docs = [{'n': i, 'date': dates[i % 3]} for i in range(10)] + [{'n': i} for i in range(10, 14)]
+    db['pages'].insert_many(docs)
+    expected = [doc['_id'] for doc in db['pages'].find().sort([('date', direction), ('_id', direction)])]
+
+    seen, cursor = [], None
+    while True:
+        page = get_page('pages', 'date', direction, page_size=3, cursor=cursor)
+        seen += [doc['_id'] for doc in page['items']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert seen == expected
+    assert len(set(seen)) == len(docs)
@@ -0,0 +1,25 @@
+import database
+from database import PRODUCT_INDEX
+
+def other_workstation_adds(db, reference):
+    """Écriture d'un autre poste : produit inséré et version `produits` incrémentée"""
+    db['produits'].insert_one({'nom': 'Autre poste', 'reference': reference, 'prix_unitaire': 10})
+    db['meta'].update_one({'_id': 'versions'}, {'$inc': {'produits': 1}}, upsert=True)
+
+def test_index_reloads_after_other_workstation_write(db, product, monkeypatch):
+    product()
+    assert len(PRODUCT_INDEX.products()) == 1
+    other_workstation_adds(db, 'A1')
+    assert len(PRODUCT_INDEX.products()) == 1  # Dans le délai ttl : aucune requête
+    monkeypatch.setattr(PRODUCT_INDEX, 'ttl', 0)
+    assert PRODUCT_INDEX.by_reference('A1')['nom'] == 'Autre poste'
+
+def test_own_writes_do_not_reload_index(db, product, monkeypatch):
+    monkeypatch.setattr(PRODUCT_INDEX, 'ttl', 0)
+    first = product()
+    PRODUCT_INDEX.products()
+    product()
+    database.delete_product(first)
+    # Inséré sans incrémenter la version : visible seulement si l'index était rechargé
+    db['produits'].insert_one({'nom': 'Hors index', 'reference': 'H1', 'prix_unitaire': 10})
+    assert [p['nom'] for p in PRODUCT_INDEX.products()] == ['Produit test']
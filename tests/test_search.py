@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+import database
+from database import add_entries_bulk, add_exit, parse_date_range, search_entries, search_exits, update_product
+
+def test_short_prefix_keeps_newest_movements_of_every_product(db):
+    """Plus de produits correspondants que l'ancienne limite de 1000 identifiants"""
+    now = datetime.now()
+    ids = db['produits'].insert_many([
+        {'nom': f"Câble {i}", 'reference': f"C{i}", 'quantite_stock': 0, 'mots_cles': ['cable', str(i), f"c{i}"]}
+        for i in range(1100)
+    ]).inserted_ids
+    add_entries_bulk([{'produit_id': str(pid), 'quantite_entree': 1, 'date_entree': now - timedelta(minutes=i)}
+                      for i, pid in enumerate(reversed(ids))])
+    results = search_entries('c')
+    assert len(results) == database.SEARCH_LIMIT
+    assert [row['produit_id'] for row in results[:3]] == [ids[-1], ids[-2], ids[-3]]
+    assert results == sorted(results, key=lambda row: row['date_entree'], reverse=True)
+
+def test_exit_search_matches_product_and_destination(db, product):
+    product_id = product(stock=5, nom='Écran large')
+    add_exit({'produit_id': product_id, 'quantite_sortie': 1, 'destination': 'Vente en ligne'})
+    assert len(search_exits('ecran')) == 1
+    assert len(search_exits('ecran vente')) == 1
+    assert search_exits('ecran casse') == []
+
+def test_renamed_product_movements_are_found_by_new_name(db, product):
+    product_id = product(stock=0, nom='Souris')
+    add_entries_bulk([{'produit_id': product_id, 'quantite_entree': 2}])
+    update_product(product_id, {'nom': 'Trackball', 'reference': 'T0'})
+    assert search_entries('souris') == []
+    [entry] = search_entries('track')
+    assert entry['produit_nom'] == 'Trackball'
+    assert entry['produit_id'] == ObjectId(product_id)
+
+def test_reversed_date_range_is_put_back_in_order():
+    assert parse_date_range('2025-10-15..2025-10-01') == parse_date_range('2025-10-01..2025-10-15') \
+        == (datetime(2025, 10, 1), datetime(2025, 10, 16))
+
+def test_several_periods_match_either(db, product):
+    product_id = product()
+    add_entries_bulk([{'produit_id': product_id, 'quantite_entree': 1, 'date_entree': datetime(2025, month, 10)}
+                      for month in (1, 2, 3)])
+    assert [e['date_entree'].month for e in search_entries('2025-01 2025-03')] == [3, 1]
+    assert [e['date_entree'].month for e in search_entries('produit 2025-02')] == [2]
+
+def test_legacy_movements_are_found_after_reference_migration(db, product):
+    product_id = product(nom='Clavier')
+    db['entrees_stock'].insert_one({'produit_id': product_id, 'quantite_entree': 1, 'date_entree': datetime.now()})
+    database.ensure_search_keys()
+    assert search_entries('clavier') == []  # Ancien mouvement : ni nom ni mots-clés
+    database.migrate_movement_references()
+    [entry] = search_entries('clavier')
+    assert entry['produit_nom'] == 'Clavier'
+    assert database.ensure_search_keys() == 0  # Mots-clés déjà calculés par la migration
@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timedelta
+import mongomock
+from bson import ObjectId
+import database
+from database import (
+    add_entry, add_entries_bulk, delete_entry, stock_as_of, take_stock_snapshot, take_snapshot_if_due,
+    SNAPSHOT_LOCK
+)
+
+def tick():
+    """Les dates BSON sont à la milliseconde : sépare deux écritures successives"""
+    time.sleep(0.005)
+
+def test_deleted_entry_is_removed_from_snapshot(db, product):
+    product_id = product()
+    entry_id = add_entry({'produit_id': product_id, 'quantite_entree': 5,
+                          'date_entree': datetime.now() - timedelta(hours=1)})
+    tick()
+    take_stock_snapshot()
+    tick()
+    delete_entry(entry_id)
+    assert stock_as_of(datetime.now()).get(ObjectId(product_id), 0) == 0
+    assert db['stock_snapshots'].count_documents({}) == 1
+    assert db['stock_snapshot_chunks'].find_one()['quantites'] == [0]
+
+def test_deleting_entry_made_after_snapshot_leaves_it_unchanged(db, product):
+    product_id = product()
+    add_entry({'produit_id': product_id, 'quantite_entree': 2})
+    tick()
+    take_stock_snapshot()
+    tick()
+    entry_id = add_entry({'produit_id': product_id, 'quantite_entree': 5})
+    delete_entry(entry_id)
+    assert db['stock_snapshot_chunks'].find_one()['quantites'] == [2]
+    assert stock_as_of(datetime.now())[ObjectId(product_id)] == 2
+
+def test_backdated_bulk_entry_after_snapshot_is_replayed(db, product):
+    product_id = product()
+    take_stock_snapshot()
+    tick()
+    add_entries_bulk([{'produit_id': product_id, 'quantite_entree': 3,
+                       'date_entree': datetime.now() - timedelta(days=2)}])
+    assert db['entrees_stock'].find_one()['hors_ordre'] is True
+    assert stock_as_of(datetime.now())[ObjectId(product_id)] == 3
+    assert stock_as_of(datetime.now() - timedelta(days=1))[ObjectId(product_id)] == 3
+    assert stock_as_of(datetime.now() - timedelta(days=3)).get(ObjectId(product_id), 0) == 0
+
+def test_postdated_entry_before_snapshot_is_removed(db, product):
+    product_id = product()
+    add_entry({'produit_id': product_id, 'quantite_entree': 4, 'date_entree': datetime.now() + timedelta(days=2)})
+    add_entry({'produit_id': product_id, 'quantite_entree': 1})
+    assert 'hors_ordre' not in db['entrees_stock'].find_one({'quantite_entree': 1})
+    tick()
+    take_stock_snapshot()
+    assert stock_as_of(datetime.now())[ObjectId(product_id)] == 1
+    assert stock_as_of(datetime.now() + timedelta(days=3))[ObjectId(product_id)] == 5
+
+def test_date_before_first_snapshot_replays_backwards(db, product):
+    product_id = product()
+    add_entries_bulk([{'produit_id': product_id, 'quantite_entree': 3, 'date_entree': datetime.now() - timedelta(days=5)}])
+    add_entry({'produit_id': product_id, 'quantite_entree': 2, 'date_entree': datetime.now() - timedelta(days=1)})
+    tick()
+    take_stock_snapshot()
+    assert stock_as_of(datetime.now() - timedelta(days=2))[ObjectId(product_id)] == 3
+    assert stock_as_of(datetime.now() - timedelta(days=6))[ObjectId(product_id)] == 0
+
+def test_movement_during_snapshot_is_counted_once(db, product, monkeypatch):
+    """Entrées saisies pendant la lecture : A est déjà lu, B pas encore"""
+    first, second = product(), product()
+    monkeypatch.setattr(database, 'SNAPSHOT_CHUNK_SIZE', 1)
+    insert_one = mongomock.Collection.insert_one
+    written = []
+
+    def insert_then_write(self, document, *args, **kwargs):
+        result = insert_one(self, document, *args, **kwargs)
+        if self.name == 'stock_snapshot_chunks' and not written:
+            written.append(document)
+            tick()
+            add_entry({'produit_id': first, 'quantite_entree': 2})
+            add_entry({'produit_id': second, 'quantite_entree': 4})
+            tick()
+        return result
+
+    monkeypatch.setattr(mongomock.Collection, 'insert_one', insert_then_write)
+    take_stock_snapshot()
+    chunks = list(db['stock_snapshot_chunks'].find().sort('chunk', 1))
+    assert [c['quantites'] for c in chunks] == [[0], [4]]
+    stocks = stock_as_of(datetime.now())
+    assert stocks[ObjectId(first)] == 2
+    assert stocks[ObjectId(second)] == 4
+
+def test_snapshot_if_due_skips_when_locked(db):
+    db['meta'].insert_one({'_id': f'verrou_{SNAPSHOT_LOCK}', 'poste': 'autre',
+                           'expire': datetime.now() + timedelta(hours=1)})
+    assert take_snapshot_if_due() is None
+    assert db['stock_snapshots'].count_documents({}) == 0
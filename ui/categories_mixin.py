@@ -1,24 +1,13 @@
-from PySide6.QtWidgets import QTableWidget, QTableWidgetItem
-from database import get_all_categories, delete_category, search_categories
+from PySide6.QtWidgets import QTableView
+from database import get_categories_page, get_category, delete_category, search_categories
 from .forms import CategoryForm
+from .crud_mixin import CLIENT_FILTER_LIMIT
 
 class CategoriesMixin:
     def create_category_widget(self):
-        self.category_table = QTableWidget()
-        headers = ['Nom', 'Description']
+        self.category_table = QTableView()
         columns_map = {'Nom': 'nom_categorie', 'Description': 'description'}
-        return self.create_crud_widget(self.category_table, self.load_categories_data, self.load_categories, search_categories, CategoryForm, delete_category, headers, columns_map, 'Catégories')
-
-    def load_categories_data(self):
-        return get_all_categories()
+        return self.create_crud_widget(self.category_table, get_categories_page, get_category, search_categories, CategoryForm, delete_category, columns_map, 'Catégories', client_filter_limit=CLIENT_FILTER_LIMIT)
 
     def load_categories(self):
-        cats = self.load_categories_data()
-        self.category_table.setRowCount(len(cats))
-        self.category_table.setColumnCount(3)
-        self.category_table.setHorizontalHeaderLabels(['Nom', 'Description', 'ID'])
-        self.category_table.setColumnHidden(2, True)
-        for i, c in enumerate(cats):
-            self.category_table.setItem(i, 0, QTableWidgetItem(c.get('nom_categorie', '')))
-            self.category_table.setItem(i, 1, QTableWidgetItem(c.get('description', '')))
-            self.category_table.setItem(i, 2, QTableWidgetItem(str(c['_id'])))
\ No newline at end of file
+        self.reload_section('Catégories')
@@ -1,7 +1,24 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView
-from datetime import datetime
-from bson import ObjectId
-from database import DB
+import os
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox, QTableView, QHeaderView
+from database import REFERENCES, resolve_references
+from .table_model import ColumnStoreModel, MultiColumnFilterProxy
+from .workers import ChangeBatch, DebouncedSearch, TaskRunner
+
+# Sections triées du plus récent au plus ancien : une insertion va en tête
+NEWEST_FIRST_SECTIONS = ('Entrées', 'Sorties', 'Historique')
+# En dessous de cette taille, une section est chargée entière et filtrée localement
+CLIENT_FILTER_LIMIT = int(os.environ.get('STOCK_CLIENT_FILTER_LIMIT', 2000))
+# Sections dont l'affichage dépend d'une écriture dans la section clé (noms résolus,
+# stocks, historique des actions, compteurs du tableau de bord)
+SECTION_DEPENDENTS = {
+    'Produits': ('Dashboard', 'Entrées', 'Sorties', 'Historique'),
+    'Fournisseurs': ('Produits', 'Entrées', 'Historique'),
+    'Catégories': ('Dashboard', 'Produits', 'Historique'),
+    'Utilisateurs': ('Historique',),
+    'Entrées': ('Dashboard', 'Produits', 'Historique'),
+    'Sorties': ('Dashboard', 'Produits', 'Historique'),
+}
 
 class CrudMixin:
     def open_form_for_section(self, form_class, section, item_data=None):
@@ -9,9 +26,10 @@ class CrudMixin:
         refresher = self.section_refreshers.get(section)
         if refresher:
             dialog.saved.connect(refresher)
+        dialog.saved.connect(lambda: self.mark_dependents_stale(section))
         dialog.exec()
 
-    def create_crud_widget(self, table, data_getter, refresher, search_func, form_class, delete_func, headers, columns_map, section, enable_edit=True):
+    def create_crud_widget(self, table, page_loader, item_getter, search_func, form_class, delete_func, columns_map, section, enable_edit=True, client_filter_limit=0):
         widget = QWidget()
         layout = QVBoxLayout(widget)
         layout.setContentsMargins(30, 30, 30, 30)
@@ -21,9 +39,12 @@ class CrudMixin:
         search_label = QLabel("Recherche :")
         search_input = QLineEdit()
         search_input.setPlaceholderText("Tapez pour filtrer...")
-        search_input.textChanged.connect(lambda text: self.filter_table(table, search_func, text, columns_map))
+        search_input.textChanged.connect(lambda text: self.filter_table(section, text))
+        loading_label = QLabel("Chargement…")
+        loading_label.setVisible(False)
         search_layout.addWidget(search_label)
         search_layout.addWidget(search_input)
+        search_layout.addWidget(loading_label)
         layout.addLayout(search_layout)
         
         # Boutons CRUD
@@ -35,84 +56,156 @@ class CrudMixin:
         
         if enable_edit:
             edit_btn = QPushButton("Modifier")
-            edit_btn.clicked.connect(lambda: self.edit_item(table, data_getter, form_class, section))
+            edit_btn.clicked.connect(lambda: self.edit_item(section, form_class))
             btn_layout.addWidget(edit_btn)
         
         del_btn = QPushButton("Supprimer")
-        del_btn.clicked.connect(lambda: self.delete_item(table, delete_func, refresher))
+        del_btn.clicked.connect(lambda: self.delete_item(section, delete_func))
         btn_layout.addWidget(del_btn)
         
         layout.addLayout(btn_layout)
         
-        # Tableau
+        # Tableau : modèle par colonnes, pages chargées au défilement. Lectures, résolution
+        # des noms et formatage passent par le runner de la section (hors thread graphique).
+        runner = TaskRunner(parent=table)
+        runner.busy_changed.connect(loading_label.setVisible)
+        runner.failed.connect(lambda message: QMessageBox.warning(self, "Erreur", f"Chargement impossible : {message}"))
+        model = ColumnStoreModel(columns_map, page_loader, enrich=lambda docs: self.enrich_data(docs, columns_map),
+                                 runner=runner, parent=table)
+        model.loaded.connect(lambda reset: reset and self.on_section_loaded(section))
+        proxy = MultiColumnFilterProxy(table)
+        proxy.setSourceModel(model)
+        table.setModel(proxy)
+        search = DebouncedSearch(lambda query: model.prepare(search_func(query)), runner, parent=table)
+        search.results.connect(model.set_prepared)
+        changes = ChangeBatch(model.prepare, parent=table)  # Change stream : lignes préparées par lots
+        changes.ready.connect(lambda prepared: self.apply_prepared_changes(section, prepared))
+        changes.runner.failed.connect(lambda message: self.mark_stale(section))
         table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.setSelectionBehavior(QTableView.SelectRows)
         layout.addWidget(table)
         
-        refresher()  # Charge initial
-        return widget
-
-    def filter_table(self, table, search_func, query, columns_map):
-        data = search_func(query) if query else search_func('')
-        data = self.enrich_data(data, columns_map)  # Enrich if needed
-        table.setRowCount(len(data))
-        if data:
-            num_cols = len(columns_map)
-            table.setColumnCount(num_cols + 1)
-            table.setHorizontalHeaderLabels(list(columns_map.keys()) + ['ID'])
-            table.setColumnHidden(num_cols, True)
-            for i, item in enumerate(data):
-                for col_idx, (header, key) in enumerate(columns_map.items()):
-                    value = item.get(key, '')
-                    if isinstance(value, datetime):
-                        value = value.strftime('%Y-%m-%d')
-                    table.setItem(i, col_idx, QTableWidgetItem(str(value)))
-                table.setItem(i, num_cols, QTableWidgetItem(str(item['_id'])))
-            table.resizeColumnsToContents()
+        if not hasattr(self, 'crud_tables'):
+            self.crud_tables = {}
+        self.crud_tables[section] = {'table': table, 'model': model, 'proxy': proxy, 'columns_map': columns_map,
+                                     'search_input': search_input, 'search': search, 'runner': runner, 'changes': changes, 'item_getter': item_getter,
+                                     'client_filter_limit': client_filter_limit, 'client_mode': False}
+        
+        return widget  # Données chargées à l'affichage de la section (switch_section)
+
+    def reload_section(self, section):
+        """Recharge le tableau d'une section (première page, ou résultats de la recherche en cours)"""
+        info = self.crud_tables[section]
+        query = info['search_input'].text()
+        if query and not info['client_mode']:
+            info['search'].request(query, immediate=True)
+        else:
+            self.load_section_rows(section)
+
+    def load_section_rows(self, section):
+        """Recharge la section en arrière-plan ; on_section_loaded() applique le mode de filtrage"""
+        info = self.crud_tables[section]
+        info['search'].cancel()  # Un résultat de recherche en retard ne doit pas écraser la liste
+        info['model'].reload(complete_below=info['client_filter_limit'])
+
+    def on_section_loaded(self, section):
+        """Passe en filtrage local si la section a été chargée entière"""
+        info = self.crud_tables[section]
+        info['client_mode'] = bool(info['client_filter_limit']) and info['model'].is_complete()
+        query = info['search_input'].text()
+        info['proxy'].set_query(query if info['client_mode'] else '')
+        if query and not info['client_mode']:
+            info['search'].request(query, immediate=True)  # Saisie faite pendant le chargement
+        table = info['table']
+        if not info['client_mode'] or not table.isSortingEnabled():
+            table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+            info['proxy'].sort(-1)  # Ordre du serveur (un tri choisi en mode local est conservé)
+        table.setSortingEnabled(info['client_mode'])
+
+    def filter_table(self, section, query, immediate=False):
+        info = self.crud_tables[section]
+        if info['client_mode']:
+            info['proxy'].set_query(query)  # Collection en mémoire : aucune requête
+        elif query:
+            info['search'].request(query, immediate)
+        else:
+            self.load_section_rows(section)
+
+    def cancel_section_loads(self, keep=None):
+        """Abandonne les chargements et recherches en cours des sections autres que `keep`"""
+        if keep != 'Dashboard' and self.dashboard_runner.busy:
+            self.dashboard_runner.cancel()
+            self.mark_stale('Dashboard')
+        for section, info in getattr(self, 'crud_tables', {}).items():
+            if section != keep:
+                if info['runner'].busy:
+                    self.mark_stale(section)  # Chargement interrompu : à reprendre à la prochaine visite
+                info['search'].cancel()
+
+    def mark_stale(self, *sections):
+        """Marque des sections à recharger à leur prochaine visite"""
+        self.stale_sections.update(sections)
+
+    def mark_dependents_stale(self, section):
+        """Après une écriture dans `section`, marque les sections qui en affichent des données"""
+        self.mark_stale(*SECTION_DEPENDENTS.get(section, ()))
+
+    def selected_id(self, section):
+        """Identifiant du document de la ligne sélectionnée, ou None"""
+        info = self.crud_tables[section]
+        rows = info['table'].selectionModel().selectedRows()
+        return info['model'].id_at(info['proxy'].mapToSource(rows[0]).row()) if rows else None
+
+    def apply_change(self, section, operation, doc_id, document):
+        """Met en file le changement d'un document ; appliqué par lot (apply_prepared_changes)"""
+        info = getattr(self, 'crud_tables', {}).get(section)
+        if info:  # Sinon section pas encore construite : chargée à sa première visite
+            info['changes'].add(operation, doc_id, document)
+
+    def apply_prepared_changes(self, section, prepared):
+        """Répercute un lot de changements sur les seules lignes concernées du tableau"""
+        info = self.crud_tables[section]
+        model = info['model']
+        for operation, doc_id, cells in prepared:
+            if cells is None:
+                model.remove_row(doc_id)
+            elif model.row_of(doc_id) is not None:
+                model.upsert_prepared(doc_id, cells)
+            elif operation != 'insert' or (info['search_input'].text() and not info['client_mode']):
+                continue  # Ligne absente de la vue courante (filtrée)
+            elif section in NEWEST_FIRST_SECTIONS:
+                model.upsert_prepared(doc_id, cells, 0)
+            elif not model.canFetchMore():
+                model.upsert_prepared(doc_id, cells)  # Sinon la ligne arrivera avec la dernière page
 
     def enrich_data(self, data, columns_map):
-        if 'produit_nom' in columns_map.values() or 'role' in columns_map.values():
-            for h in data:
-                if 'produit_id' in h and h.get('produit_id'):
-                    prod = DB['produits'].find_one({'_id': ObjectId(h['produit_id'])})
-                    h['produit_nom'] = prod['nom'] if prod else ''
-                else:
-                    h['produit_nom'] = ''
-                if 'utilisateur_id' in h and h.get('utilisateur_id'):
-                    user = DB['utilisateurs'].find_one({'_id': ObjectId(h['utilisateur_id'])})
-                    h['role'] = user['role'] if user else ''
-                else:
-                    h['role'] = ''
-                if 'fournisseur_id' in h and h.get('fournisseur_id'):
-                    fourn = DB['fournisseurs'].find_one({'_id': ObjectId(h['fournisseur_id'])})
-                    h['fournisseur_nom'] = fourn['nom_fournisseur'] if fourn else ''
-                else:
-                    h['fournisseur_nom'] = ''
+        fields = {key for _, _, _, key in REFERENCES} & set(columns_map.values())
+        if fields:
+            resolve_references(data, fields)
         return data
 
-    def edit_item(self, table, data_getter, form_class, section):
-        selected = table.selectedItems()
-        if not selected:
+    def edit_item(self, section, form_class):
+        item_id = self.selected_id(section)
+        if not item_id:
             QMessageBox.warning(self, "Erreur", "Sélectionnez une ligne à modifier")
             return
-        row = selected[0].row()
-        id_col = table.columnCount() - 1
-        item_id = table.item(row, id_col).text()
-        item_data = next((item for item in data_getter() if str(item['_id']) == item_id), None)
+        item_data = self.crud_tables[section]['item_getter'](item_id)
         if not item_data:
             QMessageBox.warning(self, "Erreur", "Élément non trouvé")
             return
         self.open_form_for_section(form_class, section, item_data)
 
-    def delete_item(self, table, delete_func, refresher):
-        selected = table.selectedItems()
-        if not selected:
+    def delete_item(self, section, delete_func):
+        item_id = self.selected_id(section)
+        if not item_id:
             QMessageBox.warning(self, "Erreur", "Sélectionnez une ligne à supprimer")
             return
-        row = selected[0].row()
-        id_col = table.columnCount() - 1
-        item_id = table.item(row, id_col).text()
         if QMessageBox.question(self, "Confirmation", "Supprimer cet élément ?") == QMessageBox.Yes:
-            delete_func(str(item_id))
-            refresher()
+            try:
+                delete_func(str(item_id))
+            except ValueError as e:
+                QMessageBox.warning(self, "Erreur", str(e))
+                return
+            self.reload_section(section)
+            self.mark_dependents_stale(section)
             self.refresh_dashboard()  # Refresh dashboard after deletion
\ No newline at end of file
@@ -9,12 +9,57 @@ from PySide6.QtGui import QColor
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import numpy as np
-from bson import ObjectId
-from database import get_kpi, get_stock_by_category, get_all_entries, get_all_exits, get_all_products, DB
+from database import get_kpi, get_stock_by_category, get_entries_page, get_exits_page, get_low_stock_products, resolve_references
 import matplotlib.pyplot as plt  # nécessaire pour les couleurs du pie chart
 
+def load_dashboard_data() -> dict:
+    """Lit les données du tableau de bord (exécuté par un worker, hors du thread graphique)"""
+    entries = get_entries_page(page_size=10)['items']
+    exits = get_exits_page(page_size=10)['items']
+    movements = []
+    for e in entries:
+        e['type'] = 'Entrée'
+        e['quantite'] = e['quantite_entree']
+        e['date'] = e['date_entree']
+        movements.append(e)
+    for s in exits:
+        s['type'] = 'Sortie'
+        s['quantite'] = s['quantite_sortie']
+        s['date'] = s['date_sortie']
+        movements.append(s)
+    movements.sort(key=lambda m: m['date'], reverse=True)
+    movements = movements[:10]  # Increased to 10 for more data
+    resolve_references(movements, {'produit_nom'})
+    return {
+        'kpi': get_kpi(),
+        'stock_data': get_stock_by_category(),  # Partagé par les deux graphiques
+        'movements': movements,
+        'low_stocks': get_low_stock_products(limit=5),  # Seuls les 5 premiers sont affichés
+    }
+
 class DashboardMixin:
     def create_dashboard(self):
+        """Widget d'attente du tableau de bord ; les données sont lues en arrière-plan"""
+        placeholder = QWidget()
+        layout = QVBoxLayout(placeholder)
+        layout.addWidget(QLabel("Chargement…", alignment=Qt.AlignCenter))
+        self.load_dashboard()
+        return placeholder
+
+    def load_dashboard(self):
+        self.dashboard_runner.submit(load_dashboard_data, on_result=self.show_dashboard)
+
+    def show_dashboard(self, data):
+        """Remplace le tableau de bord affiché par un tableau construit à partir de `data`"""
+        old_widget = self.dashboard_widget
+        self.dashboard_widget = self.section_widgets['Dashboard'] = self.build_dashboard(data)
+        self.content.insertWidget(0, self.dashboard_widget)
+        if self.current_section == 'Dashboard':
+            self.content.setCurrentWidget(self.dashboard_widget)
+        self.content.removeWidget(old_widget)
+        old_widget.deleteLater()
+
+    def build_dashboard(self, data):
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
         scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
@@ -32,14 +77,16 @@ class DashboardMixin:
         layout.addWidget(greeting)
 
         # --- KPI ---
-        kpi = get_kpi()
+        kpi = data['kpi']
         kpi_layout = QGridLayout()
         kpi_layout.setSpacing(25)
         cards = [
             (f"Total Produits\n{kpi['total_prods']}", "#ba68c8"),
             (f"Ruptures Stock\n{kpi['rupture']}", "#ef5350"),
-            (f"Entrées Récentes\n{kpi['recent_entries']}", "#66bb6a"),
-            (f"Sorties Récentes\n{kpi['recent_exits']}", "#ffa726")
+            (f"Entrées Récentes ({kpi['days']} j)\n{kpi['recent_entries']}", "#66bb6a"),
+            (f"Sorties Récentes ({kpi['days']} j)\n{kpi['recent_exits']}", "#ffa726"),
+            (f"Stock Faible\n{kpi['stock_faible']}", "#ffee58"),
+            (f"Valeur du Stock\n{kpi['valeur_stock']:,.2f}", "#42a5f5")
         ]
         for i, (text, color) in enumerate(cards):
             card = QFrame()
@@ -65,9 +112,10 @@ class DashboardMixin:
         layout.addLayout(kpi_layout)
 
         # --- Graphiques : pie + bar ---
+        stock_data = data['stock_data']
         chart_layout = QHBoxLayout()
-        chart_layout.addWidget(self.create_pie_chart_view(), stretch=1)
-        chart_layout.addWidget(self.create_bar_chart_view(), stretch=2)
+        chart_layout.addWidget(self.create_pie_chart_view(stock_data), stretch=1)
+        chart_layout.addWidget(self.create_bar_chart_view(stock_data), stretch=2)
         layout.addLayout(chart_layout)
 
         # --- Derniers mouvements ---
@@ -82,26 +130,10 @@ class DashboardMixin:
         recent_table.setAlternatingRowColors(True)
         recent_table.setStyleSheet(f"alternate-background-color: rgba(255,255,255,0.05);" if self.theme == 'dark' else "alternate-background-color: rgba(0,0,0,0.05);")
 
-        entries = get_all_entries()
-        exits = get_all_exits()
-        movements = []
-        for e in entries:
-            e['type'] = 'Entrée'
-            e['quantite'] = e['quantite_entree']
-            e['date'] = e['date_entree']
-            movements.append(e)
-        for s in exits:
-            s['type'] = 'Sortie'
-            s['quantite'] = s['quantite_sortie']
-            s['date'] = s['date_sortie']
-            movements.append(s)
-        movements.sort(key=lambda m: m['date'], reverse=True)
-        movements = movements[:10]  # Increased to 10 for more data
-
+        movements = data['movements']
         recent_table.setRowCount(len(movements))
         for i, m in enumerate(movements):
-            product = DB['produits'].find_one({'_id': ObjectId(m['produit_id'])}) or {}
-            nom = product.get('nom', 'Inconnu')
+            nom = m['produit_nom'] or 'Inconnu'
             recent_table.setItem(i, 0, QTableWidgetItem(m['type']))
             recent_table.setItem(i, 1, QTableWidgetItem(nom))
             recent_table.setItem(i, 2, QTableWidgetItem(str(m['quantite'])))
@@ -110,7 +142,7 @@ class DashboardMixin:
         layout.addWidget(recent_table)
 
         # --- Alertes stock faible ---
-        low_stocks = [p for p in get_all_products() if p['quantite_stock'] < 50]
+        low_stocks = data['low_stocks']
         if low_stocks:
             alert_label = QLabel("⚠️ Produits à stock faible : " + ", ".join(p['nom'] for p in low_stocks[:5]))
             alert_label.setStyleSheet("color: red; font-weight: bold; font-size: 14px; padding: 10px; background-color: rgba(255,0,0,0.1); border-radius: 8px; margin-top: 10px;")
@@ -122,12 +154,12 @@ class DashboardMixin:
 
     # --- Refresh dashboard ---
     def refresh_dashboard(self):
-        self.content.removeWidget(self.dashboard_widget)
-        self.dashboard_widget.deleteLater()
-        self.dashboard_widget = self.create_dashboard()
-        self.content.insertWidget(0, self.dashboard_widget)
-        if self.content.currentWidget() == self.dashboard_widget or self.section_buttons['Dashboard'].styleSheet().find('#3498db') != -1:
-            self.content.setCurrentWidget(self.dashboard_widget)
+        """Recharge le tableau de bord s'il est affiché (l'ancien reste visible jusque-là), sinon le marque à recharger"""
+        if self.current_section != 'Dashboard':
+            self.mark_stale('Dashboard')
+            return
+        self.stale_sections.discard('Dashboard')
+        self.load_dashboard()
 
     # --- Shadow effect ---
     def create_shadow_effect(self):
@@ -149,12 +181,13 @@ class DashboardMixin:
         animation.start()
 
     # --- Graphiques ---
-    def create_pie_chart_view(self):
+    def create_pie_chart_view(self, stock_data=None):
         fig = Figure(figsize=(6,6), dpi=100)
         ax = fig.add_subplot(111)
-        stock_data = get_stock_by_category()
+        if stock_data is None:
+            stock_data = get_stock_by_category()
         categories = list(stock_data.keys())
-        values = list(stock_data.values())
+        values = [stats['quantite'] for stats in stock_data.values()]
         
         # Modern pie chart with explode, shadow, and theme-aware colors
         colors = plt.cm.Set3(np.linspace(0, 1, len(categories)))  # Modern color map
@@ -178,12 +211,13 @@ class DashboardMixin:
         canvas.setMinimumHeight(400)
         return canvas
 
-    def create_bar_chart_view(self):
+    def create_bar_chart_view(self, stock_data=None):
         fig = Figure(figsize=(8,5), dpi=100)
         ax = fig.add_subplot(111)
-        stock_data = get_stock_by_category()
+        if stock_data is None:
+            stock_data = get_stock_by_category()
         categories = list(stock_data.keys())
-        values = list(stock_data.values())
+        values = [stats['quantite'] for stats in stock_data.values()]
         x = np.arange(len(categories))
         
         # Modern bar with gradient-like alpha and theme color
@@ -218,7 +252,7 @@ class DashboardMixin:
 
     # --- Vérification stock faible ---
     def check_low_stock(self):
-        low = [p for p in get_all_products() if p['quantite_stock'] < 50]
+        low = get_low_stock_products()
         if low:
             names = ", ".join(p['nom'] for p in low)
             QMessageBox.warning(self, "Alerte Stock Bas", f"Les produits suivants ont un stock bas (<50): {names}")
\ No newline at end of file
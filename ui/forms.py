@@ -2,9 +2,9 @@ from PySide6.QtWidgets import QDialog, QFormLayout, QLineEdit, QComboBox, QSpinB
 from PySide6.QtCore import Qt, Signal
 from datetime import datetime
 from database import (
-    get_all_categories, get_all_suppliers, get_all_products, add_product, update_product,
+    get_all_categories, get_all_suppliers, add_product, update_product,
     add_supplier, update_supplier, add_category, update_category, add_entry, add_exit,
-    add_user, update_user
+    add_user, update_user, PRODUCT_INDEX
 )
 
 # Style commun pour les forms
@@ -87,10 +87,14 @@ class ProductForm(QDialog):
             'prix_unitaire': self.prix_input.value(),
             'date_ajout': datetime.now()
         }
-        if self.product_id:
-            update_product(str(self.product_id), data)
-        else:
-            add_product(data)
+        try:
+            if self.product_id:
+                update_product(str(self.product_id), data)
+            else:
+                add_product(data)
+        except ValueError as e:
+            QMessageBox.warning(self, "Erreur", str(e))
+            return
         self.main_parent.refresh_dashboard()  # Refresh dashboard
         self.saved.emit()  # Signal pour notifier MainWindow
         self.accept()
@@ -108,9 +112,11 @@ class EntryForm(QDialog):
         layout = QFormLayout()
         
         self.prod_combo = QComboBox()
-        self.prod_combo.addItems([f"{p['nom']} ({p['reference']})" for p in get_all_products()])
+        for p in PRODUCT_INDEX.products():
+            self.prod_combo.addItem(f"{p['nom']} ({p['reference']})", str(p['_id']))
         self.fourn_combo = QComboBox()
-        self.fourn_combo.addItems([f['nom_fournisseur'] for f in get_all_suppliers()])
+        for f in get_all_suppliers():
+            self.fourn_combo.addItem(f['nom_fournisseur'], str(f['_id']))
         self.quant_input = QSpinBox()
         self.prix_input = QDoubleSpinBox()
         
@@ -126,26 +132,21 @@ class EntryForm(QDialog):
         self.setLayout(layout)
 
     def save(self):
-        if self.prod_combo.currentText() == '':
+        if self.prod_combo.currentData() is None:
             QMessageBox.warning(self, "Erreur", "Sélectionnez un produit")
             return
-        prod_name = self.prod_combo.currentText().split(' (')[0]
-        product = next((p for p in get_all_products() if p['nom'] == prod_name), None)
+        product = PRODUCT_INDEX.get(self.prod_combo.currentData())
         if not product:
             QMessageBox.warning(self, "Erreur", "Produit non trouvé")
             return
-        if self.fourn_combo.currentText() == '':
+        fournisseur_id = self.fourn_combo.currentData()
+        if not fournisseur_id:
             QMessageBox.warning(self, "Erreur", "Sélectionnez un fournisseur")
             return
-        fourn_name = self.fourn_combo.currentText()
-        fournisseur = next((f for f in get_all_suppliers() if f['nom_fournisseur'] == fourn_name), None)
-        if not fournisseur:
-            QMessageBox.warning(self, "Erreur", "Fournisseur non trouvé")
-            return
         
         data = {
             'produit_id': str(product['_id']),
-            'fournisseur_id': str(fournisseur['_id']),
+            'fournisseur_id': fournisseur_id,
             'quantite_entree': self.quant_input.value(),
             'prix_achat_unitaire': self.prix_input.value(),
             'date_entree': datetime.now()
@@ -171,7 +172,8 @@ class ExitForm(QDialog):
         layout = QFormLayout()
         
         self.prod_combo = QComboBox()
-        self.prod_combo.addItems([f"{p['nom']} ({p['reference']})" for p in get_all_products()])
+        for p in PRODUCT_INDEX.products():
+            self.prod_combo.addItem(f"{p['nom']} ({p['reference']})", str(p['_id']))
         self.quant_input = QSpinBox()
         self.dest_input = QLineEdit("Vente")
         
@@ -186,11 +188,10 @@ class ExitForm(QDialog):
         self.setLayout(layout)
 
     def save(self):
-        if self.prod_combo.currentText() == '':
+        if self.prod_combo.currentData() is None:
             QMessageBox.warning(self, "Erreur", "Sélectionnez un produit")
             return
-        prod_name = self.prod_combo.currentText().split(' (')[0]
-        product = next((p for p in get_all_products() if p['nom'] == prod_name), None)
+        product = PRODUCT_INDEX.get(self.prod_combo.currentData())
         if not product:
             QMessageBox.warning(self, "Erreur", "Produit non trouvé")
             return
@@ -344,10 +345,14 @@ class UserForm(QDialog):
         if password:
             data['mot_de_passe'] = password  # Sera hashé dans add_user/update_user
         
-        if self.user_id:
-            update_user(str(self.user_id), data)
-        else:
-            add_user(data)
+        try:
+            if self.user_id:
+                update_user(str(self.user_id), data)
+            else:
+                add_user(data)
+        except ValueError as e:
+            QMessageBox.warning(self, "Erreur", str(e))
+            return
         self.main_parent.refresh_dashboard()  # Refresh dashboard
         self.saved.emit()
         self.accept()
\ No newline at end of file
@@ -0,0 +1,55 @@
+from PySide6.QtCore import QThread, Signal
+from pymongo.errors import OperationFailure, PyMongoError
+from database import DB
+
+# Collections suivies et section du tableau correspondant
+WATCHED_SECTIONS = {
+    'produits': 'Produits',
+    'entrees_stock': 'Entrées',
+    'sorties_stock': 'Sorties',
+    'historique': 'Historique',
+}
+
+class ChangeWatcher(QThread):
+    """Suit le change stream de la base et émet un signal par document modifié.
+
+    Nécessite un replica set (un nœud suffit : mongod --replSet rs0 puis
+    rs.initiate()). Sur un serveur autonome, `unavailable` est émis et le thread
+    s'arrête. Après une coupure réseau, le flux reprend au dernier resume token.
+    """
+    changed = Signal(str, str, str, object)  # collection, opération, _id, document complet (ou None)
+    unavailable = Signal(str)
+
+    def __init__(self, collections=None, parent=None):
+        super().__init__(parent)
+        self.collections = list(collections or WATCHED_SECTIONS)
+        self._running = True
+        self._resume_token = None
+
+    def run(self):
+        pipeline = [{'$match': {
+            'ns.coll': {'$in': self.collections},
+            'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}
+        }}]
+        while self._running:
+            try:
+                with DB.watch(pipeline, full_document='updateLookup',
+                              resume_after=self._resume_token, max_await_time_ms=500) as stream:
+                    while self._running and stream.alive:
+                        change = stream.try_next()
+                        self._resume_token = stream.resume_token
+                        if change is None:
+                            continue
+                        operation = 'update' if change['operationType'] == 'replace' else change['operationType']
+                        self.changed.emit(change['ns']['coll'], operation,
+                                          str(change['documentKey']['_id']), change.get('fullDocument'))
+            except OperationFailure as e:
+                self.unavailable.emit(str(e))  # Serveur sans change stream
+                return
+            except PyMongoError:
+                if self._running:
+                    self.msleep(2000)  # Nouvel essai de connexion
+
+    def stop(self):
+        self._running = False
+        self.wait(2000)
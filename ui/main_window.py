@@ -5,7 +5,7 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtCore import Qt, QPoint, QSize
 from PySide6.QtGui import QColor, QCursor, QFont, QBrush, QIcon, QPixmap, QPainter
-from database import get_user, get_all_products
+from database import get_user, get_low_stock_products, count_low_stock_products, get_profiler, PRODUCT_INDEX
 from .forms import UserForm
 from .dashboard_mixin import DashboardMixin
 from .crud_mixin import CrudMixin
@@ -16,6 +16,14 @@ from .users_mixin import UsersMixin
 from .entries_mixin import EntriesMixin
 from .exits_mixin import ExitsMixin
 from .history_mixin import HistoryMixin
+from .live_updates import ChangeWatcher, WATCHED_SECTIONS
+from .workers import TaskRunner
+from .profiler_dialog import ProfilerDialog
+
+# Sections tenues à jour par le change stream ; Fournisseurs, Catégories et
+# Utilisateurs ne sont pas suivis : les écritures des autres postes n'y sont
+# visibles qu'en rechargeant la section
+LIVE_SECTIONS = set(WATCHED_SECTIONS.values())
 
 class MainWindow(QMainWindow, DashboardMixin, CrudMixin, ProductsMixin, SuppliersMixin, CategoriesMixin, UsersMixin, EntriesMixin, ExitsMixin, HistoryMixin):
     def __init__(self, user_id):
@@ -47,7 +55,7 @@ QPushButton:hover {
     background-color: #1a2742;
     color: #e6e6e6;
 }
-QTableWidget {
+QTableView {
     background-color: #111a2d;
     gridline-color: #2c3b55;
     border-radius: 12px;
@@ -131,7 +139,7 @@ QLabel#badgeLabel {
     QPushButton:hover {
         background-color: #03346e; /* Bleu foncé au hover */
     }
-    QTableWidget {
+    QTableView {
         background-color: #ffffff;
         gridline-color: #e0e0e0;
         border-radius: 8px;
@@ -341,25 +349,24 @@ QMenu::item:selected {
         
         self.main_layout.addLayout(content_layout)
         
-        # Widgets
-        self.dashboard_widget = self.create_dashboard()
-        self.product_widget = self.create_product_widget()
-        self.supplier_widget = self.create_supplier_widget()
-        self.category_widget = self.create_category_widget()
-        self.user_widget = self.create_user_widget()
-        self.entry_widget = self.create_entry_widget()
-        self.exit_widget = self.create_exit_widget()
-        self.history_widget = self.create_history_widget()
-        
-        for w in [
-            self.dashboard_widget, self.product_widget, self.supplier_widget,
-            self.category_widget, self.user_widget, self.entry_widget, 
-            self.exit_widget, self.history_widget
-        ]:
-            self.content.addWidget(w)
-        
-        self.switch_section('Dashboard')
-        self.update_notification_count()
+        # Sections construites à la première visite ; seules les données de la
+        # section affichée sont chargées (voir switch_section)
+        self.section_builders = {
+            'Dashboard': self.create_dashboard,
+            'Produits': self.create_product_widget,
+            'Fournisseurs': self.create_supplier_widget,
+            'Catégories': self.create_category_widget,
+            'Utilisateurs': self.create_user_widget,
+            'Entrées': self.create_entry_widget,
+            'Sorties': self.create_exit_widget,
+            'Historique': self.create_history_widget
+        }
+        self.section_widgets = {}
+        self.stale_sections = set(self.section_builders)  # À (re)charger à la prochaine visite
+        self.current_section = None
+        self.live_updates = True  # Faux si le serveur n'a pas de change stream
+        self.dashboard_runner = TaskRunner(parent=self)  # Données du tableau de bord, hors thread graphique
+        self.dashboard_runner.failed.connect(lambda message: QMessageBox.warning(self, "Erreur", f"Chargement impossible : {message}"))
 
         # Dict des fonctions de refresh par section
         self.section_refreshers = {
@@ -372,7 +379,32 @@ QMenu::item:selected {
             'Historique': self.load_history
         }
 
-        self.switch_theme()
+        self.switch_theme()  # Avant la première section : le tableau de bord est construit une seule fois
+        self.switch_section('Dashboard')
+        self.update_notification_count()
+
+        # Mises à jour en direct des tableaux (change streams)
+        self.change_watcher = ChangeWatcher(parent=self)
+        self.change_watcher.changed.connect(self.on_database_change)
+        self.change_watcher.unavailable.connect(self.on_live_updates_unavailable)
+        self.change_watcher.start()
+
+    def on_database_change(self, collection, operation, doc_id, document):
+        if collection == 'produits':
+            PRODUCT_INDEX.apply_change(operation, doc_id, document)
+        section = WATCHED_SECTIONS[collection]
+        if section not in self.stale_sections:
+            self.apply_change(section, operation, doc_id, document)  # Sans effet si la section n'est pas construite
+        if collection != 'historique':
+            self.mark_stale('Dashboard')
+
+    def on_live_updates_unavailable(self, message):
+        # Changements des autres postes invisibles : chaque visite recharge la section
+        self.live_updates = False
+
+    def closeEvent(self, event):
+        self.change_watcher.stop()
+        super().closeEvent(event)
 
     def switch_theme(self):
         if self.theme == 'dark':
@@ -435,6 +467,9 @@ QMenu::item:selected {
         """)
         edit_action = menu.addAction("Modifier le profil")
         theme_action = menu.addAction("Changer thème")
+        profiler_action = None
+        if get_profiler() and self.user.get('role') == 'admin':
+            profiler_action = menu.addAction("Profilage des requêtes")
         logout_action = menu.addAction("Déconnexion")
         action = menu.exec_(QCursor.pos())
         if action == edit_action:
@@ -443,6 +478,8 @@ QMenu::item:selected {
             dialog.exec()
         elif action == theme_action:
             self.switch_theme()
+        elif profiler_action and action == profiler_action:
+            ProfilerDialog(get_profiler(), self).exec()
         elif action == logout_action:
             self.logout()
 
@@ -465,6 +502,7 @@ QMenu::item:selected {
         self.profile_btn.setIcon(QIcon(avatar_pixmap))
 
     def switch_section(self, section):
+        self.cancel_section_loads(keep=section)  # Résultats d'un onglet quitté : inutiles
         if self.theme == 'dark':
             inactive_style = "padding: 12px; text-align: left; font-weight: bold; background-color: transparent; color: #e6e6e6; border-radius: 20px;"
             active_style = "padding: 12px; text-align: left; font-weight: bold; background-color: #5a8dee; color: white; border-radius: 20px;"
@@ -475,35 +513,37 @@ QMenu::item:selected {
             btn.setStyleSheet(inactive_style)
         self.section_buttons[section].setStyleSheet(active_style)
         self.title_label.setText(section)
+        self.current_section = section
+        widget = self.section_widgets.get(section)
+        if widget is None:
+            widget = self.build_section(section)
+        self.content.setCurrentWidget(widget)
+        if section in self.stale_sections or (section != 'Dashboard' and not self.is_live(section)):
+            self.stale_sections.discard(section)
+            if section == 'Dashboard':
+                self.refresh_dashboard()
+            else:
+                self.section_refreshers[section]()
+
+    def is_live(self, section):
+        """Vrai si le change stream tient la section à jour ; sinon chaque visite la recharge"""
+        return self.live_updates and section in LIVE_SECTIONS
+
+    def build_section(self, section):
+        """Construit le widget d'une section et l'ajoute au contenu (tableaux chargés ensuite par switch_section)"""
+        widget = self.section_builders[section]()
+        self.section_widgets[section] = widget
+        self.content.addWidget(widget)
         if section == 'Dashboard':
-            self.content.setCurrentWidget(self.dashboard_widget)
-            #self.check_low_stock()
-        elif section == 'Produits':
-            self.content.setCurrentWidget(self.product_widget)
-            self.load_products()
-        elif section == 'Fournisseurs':
-            self.content.setCurrentWidget(self.supplier_widget)
-            self.load_suppliers()
-        elif section == 'Catégories':
-            self.content.setCurrentWidget(self.category_widget)
-            self.load_categories()
-        elif section == 'Utilisateurs':
-            self.content.setCurrentWidget(self.user_widget)
-            self.load_users()
-        elif section == 'Entrées':
-            self.content.setCurrentWidget(self.entry_widget)
-            self.load_entries()
-        elif section == 'Sorties':
-            self.content.setCurrentWidget(self.exit_widget)
-            self.load_exits()
-        elif section == 'Historique':
-            self.content.setCurrentWidget(self.history_widget)
-            self.load_history()
+            self.dashboard_widget = widget
+            self.stale_sections.discard(section)  # create_dashboard() lance déjà la lecture de ses données
+        return widget
+
     def show_search(self):
         QMessageBox.information(self, "Recherche", "Fonction de recherche globale à implémenter.")
 
     def show_notifications(self):
-        low_stocks = [p for p in get_all_products() if p['quantite_stock'] < 50]
+        low_stocks = get_low_stock_products()
         menu = QMenu(self)
         if self.theme == 'light':
             menu_style = """
@@ -606,7 +646,7 @@ QMenu::item:selected {
         self.update_notification_count()
 
     def update_notification_count(self):
-        low_stocks = len([p for p in get_all_products() if p['quantite_stock'] < 50])
+        low_stocks = count_low_stock_products()  # Compté par l'index, sans lire les produits
         if low_stocks > 0:
             self.notification_badge.setText(str(low_stocks))
             self.notification_badge.setVisible(True)
@@ -0,0 +1,90 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QTextEdit, QPushButton,
+    QLabel, QFileDialog, QHeaderView
+)
+from PySide6.QtCore import Qt
+from bson import json_util
+from .forms import FORM_STYLE
+
+FUNCTION_COLUMNS = ['Fonction', 'Allers-retours', 'p50 (ms)', 'p95 (ms)', 'Max (ms)', 'Total (ms)', 'Documents', 'Erreurs']
+SLOW_COLUMNS = ['Date', 'Fonction', 'Collection', 'Opération', 'Durée (ms)']
+
+# ------------------ PROFILER DIALOG ------------------
+class ProfilerDialog(QDialog):
+    """Rapport du profileur de requêtes (réservé aux administrateurs)"""
+    def __init__(self, profiler, parent=None):
+        super().__init__(parent)
+        self.profiler = profiler
+        self.setWindowTitle("Profilage des requêtes")
+        self.resize(900, 600)
+        self.setStyleSheet(FORM_STYLE)
+        layout = QVBoxLayout()
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        self.function_table = QTableWidget(0, len(FUNCTION_COLUMNS))
+        self.function_table.setHorizontalHeaderLabels(FUNCTION_COLUMNS)
+        self.function_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.function_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.function_table)
+
+        layout.addWidget(QLabel("Commandes lentes"))
+        self.slow_table = QTableWidget(0, len(SLOW_COLUMNS))
+        self.slow_table.setHorizontalHeaderLabels(SLOW_COLUMNS)
+        self.slow_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.slow_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.slow_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.slow_table.currentCellChanged.connect(self.show_explain)
+        layout.addWidget(self.slow_table)
+        self.explain_view = QTextEdit()
+        self.explain_view.setReadOnly(True)
+        layout.addWidget(self.explain_view)
+
+        buttons = QHBoxLayout()
+        for label, slot in (("Actualiser", self.refresh), ("Exporter JSON", self.export), ("Réinitialiser", self.reset)):
+            btn = QPushButton(label)
+            btn.clicked.connect(slot)
+            buttons.addWidget(btn)
+        layout.addLayout(buttons)
+
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        self.report = self.profiler.report()
+        functions = sorted(self.report['functions'].items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        self.summary_label.setText(
+            f"{sum(stats['round_trips'] for _, stats in functions)} commandes, "
+            f"seuil de lenteur : {self.report['slow_ms']} ms"
+        )
+        self.function_table.setRowCount(len(functions))
+        for row, (name, stats) in enumerate(functions):
+            values = [name, stats['round_trips'], stats['p50_ms'], stats['p95_ms'], stats['max_ms'],
+                      stats['total_ms'], stats['documents'], stats['errors']]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(str(value))
+                if col:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.function_table.setItem(row, col, item)
+        slow = self.report['slow']
+        self.slow_table.setRowCount(len(slow))
+        for row, entry in enumerate(slow):
+            values = [entry['date'].strftime('%H:%M:%S'), entry['function'], entry['collection'],
+                      entry['operation'], entry['duration_ms']]
+            for col, value in enumerate(values):
+                self.slow_table.setItem(row, col, QTableWidgetItem(str(value)))
+        self.explain_view.clear()
+
+    def show_explain(self, row, column, previous_row, previous_column):
+        if 0 <= row < len(self.report['slow']):
+            explain = self.report['slow'][row]['explain']
+            self.explain_view.setPlainText(json_util.dumps(explain, indent=2) if explain else "Plan en cours de capture…")
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Exporter le rapport", "profil_requetes.json", "JSON (*.json)")
+        if path:
+            self.profiler.dump(path)
+
+    def reset(self):
+        self.profiler.reset()
+        self.refresh()
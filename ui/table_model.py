@@ -0,0 +1,207 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Signal
+from datetime import datetime
+from database import normalize_text
+
+def format_cell(value) -> str:
+    """Texte affiché pour une valeur de document (dates au jour près)"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+class ColumnStoreModel(QAbstractTableModel):
+    """Modèle de tableau à stockage par colonnes, alimenté page par page.
+
+    Chaque colonne est une liste de textes déjà formatés et les identifiants
+    sont dans une liste à part : aucun objet Qt n'est créé par cellule, la vue ne
+    demande à data() que les cellules visibles. Avec un `page_loader`
+    (get_*_page), canFetchMore/fetchMore ajoutent la page suivante quand la vue
+    approche de la fin ; `enrich` complète chaque lot avant stockage. Avec un
+    `runner` (TaskRunner), lectures et formatage se font hors du thread graphique.
+    """
+    loaded = Signal(bool)  # True pour un rechargement complet, False pour une page ajoutée
+
+    def __init__(self, columns_map: dict, page_loader=None, enrich=None, runner=None, parent=None):
+        super().__init__(parent)
+        self.headers = list(columns_map.keys())
+        self.keys = list(columns_map.values())
+        self.page_loader = page_loader
+        self.enrich = enrich
+        self.runner = runner
+        self._columns = [[] for _ in self.keys]
+        self._ids = []
+        self._cursor = None
+        self._paged = False
+        self._total = None
+        self._search_texts = None  # Texte normalisé de chaque ligne, calculé au premier filtrage local
+
+    # --- Interface Qt ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role in (Qt.DisplayRole, Qt.ToolTipRole) and index.isValid():
+            return self._columns[index.column()][index.row()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if self.runner and self.runner.busy:
+            return False  # Une page (ou un rechargement) est déjà en cours
+        return not parent.isValid() and self._paged and self._cursor is not None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        if self.runner:
+            self.runner.submit(self.fetch_rows, self._cursor, on_result=self.apply_loaded)
+        else:
+            self.apply_loaded(self.fetch_rows(self._cursor))
+
+    # --- Chargement ---
+    # prepare() et fetch_rows() ne touchent pas au modèle Qt : ils peuvent tourner
+    # dans un worker, le résultat est ensuite appliqué d'un bloc par apply_loaded().
+    def prepare(self, documents: list) -> tuple:
+        """Enrichit et formate des documents : (colonnes de textes, identifiants)"""
+        if self.enrich and documents:
+            self.enrich(documents)
+        columns = [[format_cell(doc.get(key)) for doc in documents] for key in self.keys]
+        return columns, [str(doc['_id']) for doc in documents]
+
+    def fetch_rows(self, cursor=None, complete_below: int = 0) -> dict:
+        """Lit une page (la première si cursor est None) et la prépare.
+
+        Pour la première page, si la collection compte au plus `complete_below`
+        documents, le reste est lu dans la foulée (is_complete() deviendra vrai).
+        """
+        first = cursor is None
+        page = self.page_loader(cursor=cursor, with_total=True) if first else self.page_loader(cursor=cursor)
+        items, next_cursor, total = page['items'], page['next_cursor'], page.get('total')
+        if first and next_cursor and total is not None and total <= complete_below:
+            rest = self.page_loader(cursor=next_cursor, page_size=complete_below)
+            items, next_cursor = items + rest['items'], rest['next_cursor']
+        return {'rows': self.prepare(items), 'cursor': next_cursor, 'total': total, 'reset': first}
+
+    def apply_loaded(self, loaded: dict):
+        """Applique sur le thread graphique le résultat de fetch_rows()"""
+        if loaded['reset']:
+            self._set_prepared(loaded['rows'], paged=True)
+            self._total = loaded['total']
+        else:
+            self._append_prepared(loaded['rows'])
+        self._cursor = loaded['cursor']
+        self.loaded.emit(loaded['reset'])
+
+    def _set_prepared(self, rows: tuple, paged: bool = False):
+        self.beginResetModel()
+        self._columns, self._ids = rows
+        self._paged = paged
+        self._cursor = None
+        self._total = None
+        self._search_texts = None
+        self.endResetModel()
+
+    def _append_prepared(self, rows: tuple):
+        columns, ids = rows
+        if not ids:
+            return
+        start = len(self._ids)
+        self.beginInsertRows(QModelIndex(), start, start + len(ids) - 1)
+        for column, values in zip(self._columns, columns):
+            column.extend(values)
+        self._ids.extend(ids)
+        self._search_texts = None
+        self.endInsertRows()
+
+    def reload(self, complete_below: int = 0):
+        """Recharge la première page (en arrière-plan si le modèle a un runner)"""
+        if self.runner:
+            self.runner.submit(self.fetch_rows, None, complete_below, on_result=self.apply_loaded)
+        else:
+            self.apply_loaded(self.fetch_rows(None, complete_below))
+
+    def is_complete(self) -> bool:
+        """Vrai si toute la collection paginée est chargée"""
+        return self._paged and self._cursor is None
+
+    def search_text(self, row: int) -> str:
+        if self._search_texts is None:
+            self._search_texts = [normalize_text(' '.join(values)) for values in zip(*self._columns)]
+        return self._search_texts[row]
+
+    def set_prepared(self, rows: tuple):
+        """Remplace le contenu par des lignes préparées par un worker (résultat de recherche, sans pagination)"""
+        self._set_prepared(rows)
+
+    # --- Accès par identifiant ---
+    def id_at(self, row: int) -> str:
+        return self._ids[row]
+
+    def row_of(self, doc_id: str):
+        try:
+            return self._ids.index(doc_id)
+        except ValueError:
+            return None
+
+    def upsert_prepared(self, doc_id: str, cells: list, row: int = None):
+        """Met à jour la ligne du document avec des textes préparés par un worker (ChangeBatch), ou l'insère à `row` (fin par défaut)"""
+        existing = self.row_of(doc_id)
+        if existing is not None:
+            for column, cell in zip(self._columns, cells):
+                column[existing] = cell
+            self._search_texts = None
+            self.dataChanged.emit(self.index(existing, 0), self.index(existing, len(self.keys) - 1))
+            return
+        row = len(self._ids) if row is None else row
+        self.beginInsertRows(QModelIndex(), row, row)
+        for column, cell in zip(self._columns, cells):
+            column.insert(row, cell)
+        self._ids.insert(row, doc_id)
+        self._search_texts = None
+        self.endInsertRows()
+
+    def remove_row(self, doc_id: str):
+        row = self.row_of(doc_id)
+        if row is not None:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            for column in self._columns:
+                del column[row]
+            del self._ids[row]
+            self._search_texts = None
+            self.endRemoveRows()
+
+class MultiColumnFilterProxy(QSortFilterProxyModel):
+    """Filtrage et tri locaux d'un ColumnStoreModel entièrement chargé.
+
+    Une ligne est gardée si chaque mot de la recherche (sans accents ni
+    majuscules) apparaît dans l'une de ses colonnes. Le tri compare les
+    nombres comme des nombres.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._words = []
+
+    def set_query(self, query: str):
+        self._words = normalize_text(query).split()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self._words:
+            return True
+        text = self.sourceModel().search_text(source_row)
+        return all(word in text for word in self._words)
+
+    def lessThan(self, left, right):
+        a, b = left.data() or '', right.data() or ''
+        try:
+            return float(a) < float(b)
+        except ValueError:
+            return normalize_text(a) < normalize_text(b)
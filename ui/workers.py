@@ -0,0 +1,170 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal
+
+SEARCH_DEBOUNCE_MS = 300  # Pause de frappe avant de lancer la requête
+CHANGE_BATCH_MS = 200  # Regroupement des événements du change stream d'une section
+
+class WorkerSignals(QObject):
+    finished = Signal(int, object)  # génération, résultat
+    failed = Signal(int, str)
+
+class Worker(QRunnable):
+    """Exécute func(*args) dans le QThreadPool et renvoie le résultat par signal.
+
+    `is_current` est vérifié juste avant l'exécution : une requête déjà
+    périmée quand un thread se libère n'est pas envoyée au serveur.
+    """
+    def __init__(self, generation, func, *args, is_current=None):
+        super().__init__()
+        self.generation = generation
+        self.func = func
+        self.args = args
+        self.is_current = is_current
+        self.signals = WorkerSignals()
+
+    def run(self):
+        if self.is_current and not self.is_current(self.generation):
+            return
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+        else:
+            self.signals.finished.emit(self.generation, result)
+
+class TaskRunner(QObject):
+    """File de chargement d'une section : seule la dernière tâche compte.
+
+    submit() lance func(*args) dans le QThreadPool ; le résultat est passé à
+    `on_result` sur le thread graphique. Chaque tâche porte une génération :
+    une nouvelle tâche ou cancel() rend les précédentes périmées et leurs
+    résultats sont ignorés. `busy_changed` sert à afficher l'état de chargement.
+    """
+    busy_changed = Signal(bool)
+    failed = Signal(str)
+
+    def __init__(self, pool: QThreadPool = None, parent=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self.generation = 0
+        self.busy = False
+        self._callbacks = {}
+
+    def submit(self, func, *args, on_result):
+        self.generation += 1
+        self._callbacks = {self.generation: on_result}
+        worker = Worker(self.generation, func, *args, is_current=self.is_current)
+        worker.signals.finished.connect(self._on_finished)  # Slot d'un QObject du thread graphique : connexion en file
+        worker.signals.failed.connect(self._on_failed)
+        self._set_busy(True)
+        self.pool.start(worker)
+
+    def cancel(self):
+        self.generation += 1
+        self._callbacks = {}
+        self._set_busy(False)
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self.generation
+
+    def _set_busy(self, busy: bool):
+        if busy != self.busy:
+            self.busy = busy
+            self.busy_changed.emit(busy)
+
+    def _on_finished(self, generation, result):
+        callback = self._callbacks.pop(generation, None)
+        if callback and self.is_current(generation):
+            self._set_busy(False)
+            callback(result)
+
+    def _on_failed(self, generation, message):
+        if self._callbacks.pop(generation, None) and self.is_current(generation):
+            self._set_busy(False)
+            self.failed.emit(message)
+
+class DebouncedSearch(QObject):
+    """Recherche avec anti-rebond, exécutée par le TaskRunner de la section.
+
+    Chaque frappe relance le minuteur et annule la tâche en cours ; seule la
+    dernière requête part après SEARCH_DEBOUNCE_MS et son résultat est émis
+    par `results`, sauf si un chargement plus récent l'a supplantée.
+    """
+    results = Signal(object)
+
+    def __init__(self, search_func, runner: TaskRunner, delay_ms: int = SEARCH_DEBOUNCE_MS, parent=None):
+        super().__init__(parent)
+        self.search_func = search_func
+        self.runner = runner
+        self._query = ''
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._submit)
+
+    def request(self, query: str, immediate: bool = False):
+        self._query = query
+        self.runner.cancel()  # Le résultat en cours devient périmé dès la frappe
+        if immediate:
+            self._timer.stop()
+            self._submit()
+        else:
+            self._timer.start()
+
+    def cancel(self):
+        self._timer.stop()
+        self.runner.cancel()
+
+    def _submit(self):
+        self.runner.submit(self.search_func, self._query, on_result=self.results.emit)
+
+
+class ChangeBatch(QObject):
+    """Regroupe les changements d'une section et les prépare hors du thread graphique.
+
+    add() accumule les événements du change stream (le dernier par document
+    l'emporte, à la place du premier). CHANGE_BATCH_MS après le premier, le lot part dans un worker :
+    `prepare(documents)` (ColumnStoreModel.prepare) résout les noms du lot en
+    quelques requêtes au lieu d'une par ligne. `ready` émet alors
+    [(opération, _id, textes des colonnes ou None si supprimé)] dans l'ordre des
+    événements. Un lot ne part qu'après l'application du précédent.
+    """
+    ready = Signal(object)
+
+    def __init__(self, prepare, delay_ms: int = CHANGE_BATCH_MS, parent=None):
+        super().__init__(parent)
+        self.prepare = prepare
+        self.runner = TaskRunner(parent=self)
+        self._pending = {}
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._submit)
+
+    def add(self, operation: str, doc_id: str, document):
+        previous = self._pending.get(doc_id)  # Un document déjà en file garde sa place
+        if document is None:
+            operation = 'delete'
+        elif previous and previous[0] == 'insert':
+            operation = 'insert'  # Inséré puis modifié dans le même lot
+        self._pending[doc_id] = (operation, document)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _submit(self):
+        if self.runner.busy:
+            self._timer.start()  # Lot précédent pas encore appliqué
+            return
+        changes, self._pending = list(self._pending.items()), {}
+        if changes:
+            self.runner.submit(self._prepare, changes, on_result=self.ready.emit)
+
+    def _prepare(self, changes: list) -> list:
+        columns, _ = self.prepare([document for _, (operation, document) in changes if operation != 'delete'])
+        prepared, position = [], 0
+        for doc_id, (operation, document) in changes:
+            if operation == 'delete':
+                prepared.append((operation, doc_id, None))
+            else:
+                prepared.append((operation, doc_id, [column[position] for column in columns]))
+                position += 1
+        return prepared